@@ -14,11 +14,30 @@ interface FormData {
   languageCode: string;
 }
 
-interface ProcessingResponse {
+interface JobStatus {
+  job_id: string;
+  status: 'queued' | 'running' | 'completed' | 'failed';
   message: string;
   files: string[];
+  error: string | null;
 }
 
+interface JobEvent {
+  id: number;
+  event: string;
+  message?: string;
+  stage?: string;
+  state?: string;
+  clip?: string;
+  percent?: number | null;
+  output?: string | null;
+  status?: JobStatus['status'];
+  files?: string[];
+  error?: string | null;
+}
+
+const API_URL = 'http://localhost:8000';
+
 // Language options array
 const languages: Language[] = [
   { name: "English", code: "en" },
@@ -165,6 +184,45 @@ const VideoTrans: React.FC = () => {
   const [isLoading, setIsLoading] = useState<boolean>(false);
   const [error, setError] = useState<string>('');
   const [videos, setVideos] = useState<string[]>([]);
+  const [jobId, setJobId] = useState<string>('');
+  const [statusMessage, setStatusMessage] = useState<string>('');
+
+  // Follow the job's event stream until it completes or fails
+  const waitForJob = (id: string): Promise<JobEvent> =>
+    new Promise((resolve, reject) => {
+      const source = new EventSource(`${API_URL}/jobs/${id}/events`);
+      const parse = (e: Event): JobEvent => JSON.parse((e as MessageEvent).data);
+
+      source.addEventListener('status', e => {
+        const event = parse(e);
+        if (event.message) setStatusMessage(event.message);
+      });
+      source.addEventListener('download', e => {
+        const { percent } = parse(e);
+        if (percent !== null && percent !== undefined) setStatusMessage(`Downloading video... ${percent}%`);
+      });
+      source.addEventListener('encode', e => {
+        const { clip, percent } = parse(e);
+        setStatusMessage(`Encoding ${clip}... ${percent}%`);
+      });
+      source.addEventListener('dub', e => {
+        const { clip, state, output } = parse(e);
+        setStatusMessage(`Dubbing ${clip}: ${state}`);
+        // Show each clip as soon as it is ready
+        if (state === 'done' && output) {
+          setVideos(prev => (prev.includes(output) ? prev : [...prev, output]));
+        }
+      });
+      source.addEventListener('done', e => {
+        source.close();
+        resolve(parse(e));
+      });
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+          reject(new Error('Lost connection to the server'));
+        }
+      };
+    });
 
   // Handle form submission
   const handleSubmit = async (e: React.FormEvent<HTMLFormElement>) => {
@@ -172,9 +230,10 @@ const VideoTrans: React.FC = () => {
     setIsLoading(true);
     setError('');
     setVideos([]);
+    setStatusMessage('');
 
     try {
-      const response = await fetch('http://localhost:8000/process-video', {
+      const response = await fetch(`${API_URL}/process-video`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -186,9 +245,15 @@ const VideoTrans: React.FC = () => {
         throw new Error('Video processing failed');
       }
 
-      const data: ProcessingResponse = await response.json();
-      console.log('Processing successful:', data);
-      setVideos(data.files);
+      const { job_id }: JobStatus = await response.json();
+      setJobId(job_id);
+
+      const job = await waitForJob(job_id);
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Video processing failed');
+      }
+      console.log('Processing successful:', job);
+      setVideos(job.files || []);
     } catch (err) {
       setError(err instanceof Error ? err.message : 'An error occurred');
     } finally {
@@ -198,7 +263,7 @@ const VideoTrans: React.FC = () => {
 
   const handleDownload = async (filename: string) => {
     try {
-      const response = await fetch(`http://localhost:8000/download-video/${filename}`);
+      const response = await fetch(`${API_URL}/download-video/${jobId}/${filename}`);
       if (!response.ok) throw new Error('Download failed');
       
       const blob = await response.blob();
@@ -310,6 +375,7 @@ const VideoTrans: React.FC = () => {
             {isLoading && (
               <div className="flex flex-col items-center space-y-4 my-8">
                 <h3 className="text-xl font-semibold text-white">Processing Your Video</h3>
+                {statusMessage && <p className="text-indigo-400">{statusMessage}</p>}
                 <p className="text-gray-400">Try to catch the dot while you wait!</p>
                 <LoadingGame />
               </div>
@@ -326,7 +392,7 @@ const VideoTrans: React.FC = () => {
                       <video 
                         controls 
                         className="w-full rounded-lg mb-4"
-                        src={`http://localhost:8000/download-video/${filename}`}
+                        src={`${API_URL}/download-video/${jobId}/${filename}`}
                       />
                       <button
                         onClick={() => handleDownload(filename)}
@@ -0,0 +1,143 @@
+import os
+import re
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Root of the job folders and caches, kept out of the source tree (and its bind mount)
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.path.expanduser("~"), ".studybite"))
+# Folder and size cap of the shared media cache
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", os.path.join(DATA_DIR, "cache"))
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(10 * 1024 ** 3)))
+
+YOUTUBE_ID_PATTERN = re.compile(r'(?:v=|youtu\.be/|/shorts/|/embed/|/live/)([A-Za-z0-9_-]{11})')
+
+
+def youtube_video_id(url: str) -> str:
+    """
+    Extracts the video ID from a YouTube URL.
+
+    Falls back to a hash of the URL so any link still gets a stable key.
+    """
+    match = YOUTUBE_ID_PATTERN.search(url)
+    if match:
+        return match.group(1)
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def file_sha256(path: str) -> str:
+    """Returns the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def copy_file(src: str, dest: str):
+    """
+    Copies `src` to `dest` as a new file.
+
+    The copy is written aside and renamed over `dest`, so `dest` always
+    ends up with its own inode: writers that later truncate or rewrite it
+    in place can never reach `src` or any other copy, even when `dest`
+    used to be a hard link.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=os.path.dirname(os.path.abspath(dest)))
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dest)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class FileCache:
+    """
+    Size-capped on-disk cache of files, evicted in least-recently-used order.
+
+    Entries are published with an atomic rename, so readers never see a
+    partially written file. Files are copied in and out rather than
+    hard-linked, so no job file shares an inode with a cache entry, and
+    recency can be tracked through the entry's own mtime.
+
+    Args:
+        root (str): Folder holding the cached files
+        max_bytes (int): Total size above which old entries are evicted
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    def create(self):
+        """Creates the cache folder, called once at startup."""
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, re.sub(r'[^A-Za-z0-9_.-]', '_', key))
+
+    def has(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def get(self, key: str, dest: str) -> bool:
+        """
+        Places the cached file for `key` at `dest`.
+
+        Returns:
+            bool: True on a cache hit, False otherwise
+        """
+        path = self._path(key)
+        with self.lock:
+            if not os.path.exists(path):
+                return False
+            os.utime(path)
+        # Copied outside the lock so a large hit does not stall other jobs
+        try:
+            copy_file(path, dest)
+        except FileNotFoundError:
+            # Evicted between the check and the copy
+            return False
+        logger.info(f"Cache hit for {key}")
+        return True
+
+    def put(self, key: str, src: str):
+        """Stores a copy of `src` under `key` and evicts old entries if needed."""
+        self.create()
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=self.root)
+        os.close(fd)
+        try:
+            shutil.copyfile(src, tmp_path)
+            with self.lock:
+                os.replace(tmp_path, self._path(key))
+                self._evict()
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.is_file() and not entry.name.startswith('.tmp-'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            logger.info(f"Evicted {os.path.basename(path)} from cache")
+
+
+# Media and transcripts shared by every job of this process
+media_cache = FileCache(MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_BYTES)
@@ -0,0 +1,116 @@
+import os
+import json
+import hashlib
+import threading
+from cache import file_sha256
+
+# Outputs above this size (e.g. the downloaded video) are fingerprinted by size and mtime only
+CHECKPOINT_HASH_MAX_BYTES = int(os.getenv("CHECKPOINT_HASH_MAX_BYTES", str(64 * 1024 ** 2)))
+
+
+def file_fingerprint(path: str) -> dict:
+    stat = os.stat(path)
+    sha256 = file_sha256(path) if stat.st_size <= CHECKPOINT_HASH_MAX_BYTES else None
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+
+
+def file_matches(path: str, fingerprint: dict) -> bool:
+    """
+    Checks that a file still has the recorded content.
+
+    Files with an unchanged size and mtime are trusted without rehashing,
+    anything else is hashed again and compared. Files that were too large
+    to hash count as changed as soon as their mtime differs.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    if stat.st_size != fingerprint["size"]:
+        return False
+    if stat.st_mtime_ns == fingerprint["mtime_ns"]:
+        return True
+    if fingerprint["sha256"] is None:
+        return False
+    return file_sha256(path) == fingerprint["sha256"]
+
+
+def result_files(result) -> list:
+    """Paths of the existing files referenced anywhere in a stage result."""
+    if isinstance(result, str):
+        return [result] if os.path.isfile(result) else []
+    if isinstance(result, (list, tuple)):
+        return [path for item in result for path in result_files(item)]
+    if isinstance(result, dict):
+        return [path for item in result.values() for path in result_files(item)]
+    return []
+
+
+class CheckpointStore:
+    """
+    Record of the completed stages of a job, kept in a JSON file.
+
+    Every checkpoint stores the stage result, a hash of the stage inputs
+    (the job context and the output hashes of its dependencies) and the
+    content hashes of its output files. A stage is restored only while
+    all of them still match, so a retried job resumes from the first
+    stage whose inputs or outputs changed.
+
+    Args:
+        path (str): JSON file holding the checkpoints
+        context: JSON-serializable values every stage depends on, e.g. the request parameters
+    """
+
+    def __init__(self, path: str, context=None):
+        self.path = path
+        self.context = context
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def _inputs_hash(self, deps) -> str:
+        inputs = {
+            "context": self.context,
+            "deps": {dep: self.entries.get(dep, {}).get("outputs") for dep in deps},
+        }
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def restore(self, stage: str, deps):
+        """
+        Returns:
+            tuple: (True, result) if the stage's checkpoint is still valid, (False, None) otherwise
+        """
+        with self.lock:
+            entry = self.entries.get(stage)
+            if entry is None or entry["inputs"] != self._inputs_hash(deps):
+                return False, None
+        if not all(file_matches(path, fingerprint) for path, fingerprint in entry["outputs"].items()):
+            return False, None
+        return True, entry["result"]
+
+    def record(self, stage: str, deps, result, outputs):
+        """
+        Saves the checkpoint of a finished stage.
+
+        Raises:
+            TypeError: If the stage result is not JSON-serializable
+        """
+        try:
+            json.dumps(result)
+        except TypeError as e:
+            raise TypeError(f"Result of stage {stage} must be JSON-serializable: {str(e)}")
+
+        fingerprints = {path: file_fingerprint(path) for path in outputs}
+        with self.lock:
+            self.entries[stage] = {
+                "inputs": self._inputs_hash(deps),
+                "outputs": fingerprints,
+                "result": result,
+            }
+            # Written aside and renamed, so a crash never leaves a truncated file
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(tmp_path, self.path)
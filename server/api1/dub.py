@@ -1,34 +1,82 @@
-from elevenlabs import ElevenLabs
+from elevenlabs import AsyncElevenLabs
+import asyncio
 import time
-import moviepy.editor as me
+import subprocess
 import os
+import threading
+from contextlib import asynccontextmanager
+from media import extract_audio, mux_audio, mux_audio_stream
+from cache import DATA_DIR, FileCache, file_sha256
+from common.metrics import external_call
+from common.probe import probe
 
-def wait_for_dubbing_completion(dubbing_id: str, client) -> bool:
+# Maximum number of clips dubbed by ElevenLabs at the same time
+DUB_CONCURRENCY = int(os.getenv("DUB_CONCURRENCY", "3"))
+# Shared by every job of this process, each of which runs its own event loop
+DUB_SLOTS = threading.BoundedSemaphore(DUB_CONCURRENCY)
+# Seconds to wait for one dubbing project before giving up
+DUB_TIMEOUT = float(os.getenv("DUB_TIMEOUT", "1200"))
+# "audio" uploads only the sound track, "video" uploads the whole clip
+DUB_MODE = os.getenv("DUB_MODE", "audio")
+
+# Finished dubs, keyed by clip content hash and target language
+dub_cache = FileCache(
+    os.getenv("DUB_CACHE_DIR", os.path.join(DATA_DIR, "dub_cache")),
+    int(os.getenv("DUB_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+)
+
+@asynccontextmanager
+async def dub_slot():
+    """
+    Holds one of the process-wide DUB_CONCURRENCY dubbing slots.
+
+    The semaphore is polled rather than waited on in a thread, so a
+    cancelled task never ends up owning a slot it cannot release.
+    """
+    while not DUB_SLOTS.acquire(blocking=False):
+        await asyncio.sleep(0.5)
+    try:
+        yield
+    finally:
+        DUB_SLOTS.release()
+
+async def wait_for_dubbing_completion(dubbing_id: str, client) -> bool:
     """
     Waits for the dubbing process to complete by periodically checking the status.
 
+    The polling interval starts short and grows, so quick clips are picked
+    up early without hammering the API on long ones.
+
     Args:
         dubbing_id (str): The dubbing project id.
-        client: Your client object
+        client: Your AsyncElevenLabs client object
 
     Returns:
         bool: True if the dubbing is successful, False otherwise.
     """
-    MAX_ATTEMPTS = 120
-    CHECK_INTERVAL = 10  # In seconds
+    MIN_INTERVAL = 2  # In seconds
+    MAX_INTERVAL = 30  # In seconds
+    BACKOFF = 1.5
 
-    for attempt in range(MAX_ATTEMPTS):
+    interval = MIN_INTERVAL
+    deadline = time.monotonic() + DUB_TIMEOUT
+    attempt = 0
+
+    while time.monotonic() < deadline:
+        attempt += 1
         try:
-            metadata = client.dubbing.get_dubbing_project_metadata(dubbing_id)
+            with external_call("elevenlabs", "status"):
+                metadata = await client.dubbing.get_dubbing_project_metadata(dubbing_id)
             if metadata.status == "dubbed":
                 return True
             elif metadata.status == "dubbing":
                 print(
-                    f"Dubbing in progress... Attempt {attempt + 1}/{MAX_ATTEMPTS}. Will check status again in",
-                    CHECK_INTERVAL,
+                    f"Dubbing {dubbing_id} in progress... Attempt {attempt}. Will check status again in",
+                    round(interval, 1),
                     "seconds.",
                 )
-                time.sleep(CHECK_INTERVAL)
+                await asyncio.sleep(interval)
+                interval = min(interval * BACKOFF, MAX_INTERVAL)
             else:
                 print("Dubbing failed:", metadata.error_message)
                 return False
@@ -41,7 +89,9 @@ def wait_for_dubbing_completion(dubbing_id: str, client) -> bool:
 
 def validate_video_file(video_path: str) -> bool:
     """
-    Validates if the video file exists and can be opened by MoviePy.
+    Validates if the video file exists and has a readable video stream.
+
+    Only the container headers are read, through the shared probe cache.
     
     Args:
         video_path (str): Path to the video file
@@ -54,110 +104,194 @@ def validate_video_file(video_path: str) -> bool:
             print(f"Video file not found: {video_path}")
             return False
             
-        clip = me.VideoFileClip(video_path)
-        if clip.reader is None:
+        if not probe(video_path).has_video:
             print(f"Cannot read video file: {video_path}")
-            clip.close()
             return False
             
-        clip.close()
         return True
     except Exception as e:
         print(f"Error validating video file {video_path}: {e}")
         return False
 
-def dub_video(video_file_name: str, elevenlabs_api_key: str, target_language_code: str, output_dir: str):
+def replace_audio(video_file_name: str, dubbed_file_path: str, output_video_path: str) -> bool:
+    """
+    Writes the original video with the audio track of the dubbed file.
+
+    The video stream is copied, only the new audio is encoded.
+
+    Returns:
+        bool: True if the output video was written, False otherwise
+    """
+    try:
+        mux_audio(video_file_name, dubbed_file_path, output_video_path)
+        print(f"Dubbed video saved to {output_video_path}")
+        return True
+    except subprocess.CalledProcessError as e:
+        print(f"Error during video processing: {e.stderr}")
+        return False
+
+def ignore_status(video_file_name, state, **details):
+    pass
+
+async def dub_video(video_file_name: str, client, target_language_code: str, output_dir: str, mode: str = DUB_MODE,
+                    on_status=ignore_status):
     '''
     Dubs the given video and saves the dubbed version in the output directory.
 
     Parameters:
     video_file_name: name of the input video file
-    elevenlabs_api_key: your generated 11 labs api key
+    client: AsyncElevenLabs client shared by the clips of a run
     target_language_code: language code of the target language
     output_dir: directory to save the output video
+    mode: "audio" to send only the audio track and get dubbed audio back,
+          "video" to send the whole clip
+    on_status: callback(video_file_name, state, **details) for progress reporting
     '''
-    if not validate_video_file(video_file_name):
+    if not await asyncio.to_thread(validate_video_file, video_file_name):
         return False
 
-    client = ElevenLabs(api_key=elevenlabs_api_key)
-    try:
-        with open(video_file_name, "rb") as video_file:
-            dub = client.dubbing.dub_a_video_or_an_audio_file(
-                target_lang=target_language_code,
-                file=video_file,
-                watermark=True
-            )
-    except Exception as e:
-        print(f"Error initiating dubbing: {e}")
-        return False
+    output_video_path = os.path.join(output_dir, f"{os.path.basename(video_file_name)}")
 
-    dubbing_id = dub.dict()["dubbing_id"]
-    if not wait_for_dubbing_completion(dubbing_id, client):
-        return False
+    # The same clip dubbed into the same language needs no new round-trip
+    cache_key = f"{await asyncio.to_thread(file_sha256, video_file_name)}.{target_language_code}.mp4"
+    if await asyncio.to_thread(dub_cache.get, cache_key, output_video_path):
+        print(f"Dubbed video for {video_file_name} loaded from cache")
+        on_status(video_file_name, "cached")
+        return True
+
+    # A previous attempt's output may share its inode with an older cache entry
+    # or be mid-download by a client: unlink it so ffmpeg writes a new file
+    if os.path.exists(output_video_path):
+        os.remove(output_video_path)
+
+    base_name = os.path.splitext(os.path.basename(video_file_name))[0]
+    upload_path = video_file_name
+    temp_files = []
 
-    print(f"Downloading the dubbed video for {video_file_name}...")
-    dubbed_video_path = os.path.join(output_dir, f"dubbed-{os.path.basename(video_file_name)}")
-    
-    # Download the dubbed video
     try:
-        with open(dubbed_video_path, "wb") as f:
-            for chunk in client.dubbing.get_dubbed_file(dubbing_id, target_language_code):
-                f.write(chunk)
-    except Exception as e:
-        print(f"Error downloading dubbed video: {e}")
-        return False
+        if mode == "audio":
+            upload_path = os.path.join(output_dir, f"{base_name}-source.m4a")
+            temp_files.append(upload_path)
+            try:
+                await asyncio.to_thread(extract_audio, video_file_name, upload_path)
+            except subprocess.CalledProcessError as e:
+                print(f"Error extracting audio: {e.stderr}")
+                return False
 
-    # Validate the dubbed video file
-    if not validate_video_file(dubbed_video_path):
-        print("Downloaded dubbed video is invalid")
-        return False
+        on_status(video_file_name, "uploading")
+        try:
+            with open(upload_path, "rb") as upload_file, external_call("elevenlabs", "submit"):
+                dub = await client.dubbing.dub_a_video_or_an_audio_file(
+                    target_lang=target_language_code,
+                    file=(os.path.basename(upload_path), upload_file, "audio/mp4" if mode == "audio" else "video/mp4"),
+                    watermark=True
+                )
+        except Exception as e:
+            print(f"Error initiating dubbing: {e}")
+            return False
 
-    original_video_clip = None
-    dubbed_video_clip = None
+        dubbing_id = dub.dict()["dubbing_id"]
+        on_status(video_file_name, "dubbing", dubbing_id=dubbing_id)
+        if not await wait_for_dubbing_completion(dubbing_id, client):
+            return False
 
-    try:
-        # Sync audio to the original video
-        original_video_clip = me.VideoFileClip(video_file_name)
-        dubbed_video_clip = me.VideoFileClip(dubbed_video_path)
+        # Audio dubs come back as MP3, video dubs as MP4
+        print(f"Downloading the dubbed {mode} for {video_file_name}...")
+        on_status(video_file_name, "downloading")
+
+        if mode == "audio":
+            # MP3 can be read as a stream: mux while the download is running
+            try:
+                with external_call("elevenlabs", "download"):
+                    await mux_audio_stream(
+                        video_file_name,
+                        client.dubbing.get_dubbed_file(dubbing_id, target_language_code),
+                        output_video_path,
+                        "mp3"
+                    )
+            except Exception as e:
+                if isinstance(e, subprocess.CalledProcessError):
+                    print(f"Error during video processing: {e.stderr}")
+                else:
+                    print(f"Error downloading dubbed {mode}: {e}")
+                # Never leave a half-written clip in the output folder
+                if os.path.exists(output_video_path):
+                    os.remove(output_video_path)
+                return False
+            print(f"Dubbed video saved to {output_video_path}")
 
-        # Validate both clips
-        if original_video_clip.reader is None or dubbed_video_clip.reader is None:
-            raise ValueError("Failed to load video clips")
+            await asyncio.to_thread(dub_cache.put, cache_key, output_video_path)
+            return True
 
-        if dubbed_video_clip.audio is None:
-            raise ValueError("Dubbed video has no audio track")
+        # MP4 keeps its index at the end, so video dubs still go through a file
+        dubbed_file_path = os.path.join(output_dir, f"dubbed-{base_name}.mp4")
+        temp_files.append(dubbed_file_path)
 
-        original_video_clip.audio = dubbed_video_clip.audio
-        output_video_path = os.path.join(output_dir, f"{os.path.basename(video_file_name)}")
-        
-        # Write the final video
-        original_video_clip.write_videofile(
-            output_video_path,
-            codec="libx264",
-            audio_codec="aac",
-            logger=None  # Suppress MoviePy's progress bar
-        )
-        
-        print(f"Dubbed video saved to {output_video_path}")
-        return True
-        
-    except Exception as e:
-        print(f"Error during video processing: {e}")
-        return False
-        
-    finally:
-        # Clean up resources
+        # Download the dubbed file
         try:
-            if original_video_clip is not None:
-                original_video_clip.close()
-            if dubbed_video_clip is not None:
-                dubbed_video_clip.close()
-            if os.path.exists(dubbed_video_path):
-                os.remove(dubbed_video_path)
+            with open(dubbed_file_path, "wb") as f, external_call("elevenlabs", "download"):
+                async for chunk in client.dubbing.get_dubbed_file(dubbing_id, target_language_code):
+                    f.write(chunk)
         except Exception as e:
-            print(f"Error during cleanup: {e}")
+            print(f"Error downloading dubbed {mode}: {e}")
+            return False
+
+        if not await asyncio.to_thread(replace_audio, video_file_name, dubbed_file_path, output_video_path):
+            return False
 
-def main_dub(api_key, language_code):
+        await asyncio.to_thread(dub_cache.put, cache_key, output_video_path)
+        return True
+    finally:
+        for temp_file in temp_files:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+
+async def dub_clips_async(api_key, language_code, video_paths, output_folder="output", on_status=ignore_status):
+    """
+    Dubs every clip yielded by `video_paths` into the output folder.
+
+    Each clip is submitted as soon as it is available, with at most
+    DUB_CONCURRENCY dubbing projects in flight across all jobs, and
+    downloaded as soon as it is done. `video_paths` may block until the next clip has been trimmed.
+
+    Returns:
+        tuple: (success count, failure count)
+    """
+    client = AsyncElevenLabs(api_key=api_key)
+
+    async def dub_one(video_path):
+        video_file = os.path.basename(video_path)
+        on_status(video_path, "queued")
+        async with dub_slot():
+            print(f"\nProcessing {video_file}...")
+            try:
+                result = await dub_video(video_path, client, language_code, output_folder, on_status=on_status)
+            except Exception as e:
+                print(f"Error processing {video_file}: {e}")
+                result = False
+        on_status(video_path, "done" if result else "failed", output=video_file if result else None)
+        return result
+
+    tasks = []
+    clips = iter(video_paths)
+    while True:
+        # The iterator may block, keep it off the event loop
+        video_path = await asyncio.to_thread(next, clips, None)
+        if video_path is None:
+            break
+        tasks.append(asyncio.create_task(dub_one(video_path)))
+
+    results = await asyncio.gather(*tasks)
+    success_count = sum(1 for result in results if result)
+    return success_count, len(results) - success_count
+
+def dub_clips(api_key, language_code, video_paths, output_folder="output", on_status=ignore_status):
+    """
+    Dubs every clip yielded by `video_paths` into the output folder.
+
+    `video_paths` may be any iterable, including one that blocks until the
+    next clip has been trimmed, so dubbing can start before trimming ends.
+    """
     if not api_key:
         print("Error: API key is required")
         return "Error: API key is required"
@@ -166,15 +300,18 @@ def main_dub(api_key, language_code):
         print("Error: Language code is required")
         return "Error: Language code is required"
 
-    clips_folder = "Clips"
-    output_folder = "output"
-
     # Create output folder if it doesn't exist
     os.makedirs(output_folder, exist_ok=True)
 
-    success_count = 0
-    failure_count = 0
+    success_count, failure_count = asyncio.run(
+        dub_clips_async(api_key, language_code, video_paths, output_folder, on_status=on_status)
+    )
+
+    message = f"Processing complete. Successfully dubbed: {success_count}, Failed: {failure_count}"
+    print(message)
+    return message
 
+def main_dub(api_key, language_code, clips_folder="Clips", output_folder="output"):
     # Process each video in the Clips folder
     if os.path.exists(clips_folder) and os.path.isdir(clips_folder):
         video_files = [f for f in os.listdir(clips_folder) 
@@ -185,21 +322,8 @@ def main_dub(api_key, language_code):
             print(message)
             return message
 
-        for video_file in video_files:
-            video_path = os.path.join(clips_folder, video_file)
-            print(f"\nProcessing {video_file}...")
-            try:
-                if dub_video(video_path, api_key, language_code, output_folder):
-                    success_count += 1
-                else:
-                    failure_count += 1
-            except Exception as e:
-                print(f"Error processing {video_file}: {e}")
-                failure_count += 1
-                
-        message = f"Processing complete. Successfully dubbed: {success_count}, Failed: {failure_count}"
-        print(message)
-        return message
+        video_paths = [os.path.join(clips_folder, video_file) for video_file in video_files]
+        return dub_clips(api_key, language_code, video_paths, output_folder)
     else:
         message = f"No Clips folder found at {clips_folder}"
         print(message)
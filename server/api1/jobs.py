@@ -0,0 +1,225 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+from retention import dir_size
+from cache import DATA_DIR
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+logger = logging.getLogger(__name__)
+
+# Root folder holding one private work directory per job
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(DATA_DIR, "jobs"))
+# Number of pipelines allowed to run at the same time
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "2"))
+
+
+class Job:
+    """
+    State of a single video processing run.
+
+    Every job owns a private work directory, so the files of concurrent
+    runs (input.mp4, transcript.srt, Clips/, output/, ...) never collide.
+    """
+
+    def __init__(self, job_id: str, work_dir: str, params: dict):
+        self.id = job_id
+        self.work_dir = work_dir
+        self.params = params
+        self.status = "queued"
+        self.message = "Waiting for a free worker"
+        self.files = []
+        self.error = None
+        self.timings = None
+        # Pipeline-specific details of the result, e.g. the clips of each topic
+        self.summary = None
+        # Size of the work directory, recorded when the job finishes
+        self.disk_bytes = None
+        # Number of times the pipeline was started, retries included
+        self.attempts = 0
+        # Progress events, streamed to clients by /jobs/{job_id}/events
+        self.events = []
+        # Events are emitted from stage, download, render and dub threads
+        self.events_lock = threading.Lock()
+        # Index of the first event of the current attempt; retries start a new one
+        self.attempt_start = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def path(self, name: str) -> str:
+        """Returns the path of a file inside the job's work directory."""
+        return os.path.join(self.work_dir, name)
+
+    @property
+    def clips_dir(self) -> str:
+        return self.path("Clips")
+
+    @property
+    def output_dir(self) -> str:
+        return self.path("output")
+
+    def emit(self, event: str, **data):
+        """Appends a progress event; its position in `events` is its ID."""
+        with self.events_lock:
+            self.events.append({"id": len(self.events), "event": event, "time": time.time(), **data})
+
+    def update(self, message: str):
+        """Records a progress message for status polling and event streams."""
+        logger.info(f"[job {self.id}] {message}")
+        self.message = message
+        self.emit("status", status=self.status, message=message)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "message": self.message,
+            "files": self.files,
+            "error": self.error,
+            "timings": self.timings,
+            "summary": self.summary,
+            "disk_bytes": self.disk_bytes,
+            "attempts": self.attempts,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    Runs pipelines on a bounded worker pool and keeps track of their state.
+
+    Args:
+        max_workers (int): Maximum number of pipelines running at once.
+            Extra jobs wait in the queue with status "queued".
+        jobs_dir (str): Folder in which job work directories are created.
+    """
+
+    def __init__(self, max_workers: int = MAX_CONCURRENT_JOBS, jobs_dir: str = JOBS_DIR):
+        self.jobs_dir = jobs_dir
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.jobs = {}
+        # Pipeline of every job, run again on retry
+        self.pipelines = {}
+        self.lock = threading.Lock()
+
+    def submit(self, pipeline, params: dict) -> Job:
+        """
+        Creates a job and schedules `pipeline(job)` on the worker pool.
+
+        The pipeline must return the list of produced file names.
+        """
+        job_id = uuid4().hex
+        self.create()
+        work_dir = tempfile.mkdtemp(prefix=f"{job_id}-", dir=self.jobs_dir)
+        job = Job(job_id, work_dir, params)
+
+        with self.lock:
+            self.jobs[job_id] = job
+            self.pipelines[job_id] = pipeline
+
+        self.executor.submit(self._run, job, pipeline)
+        logger.info(f"Queued job {job_id} in {work_dir}")
+        return job
+
+    def create(self):
+        """Creates the jobs folder, called once at startup."""
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+    def get(self, job_id: str):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def retry(self, job: Job) -> Job:
+        """
+        Queues a failed job again in its existing work directory.
+
+        The pipeline finds the files and checkpoints of the previous attempt
+        there and only redoes the stages that did not complete.
+
+        Raises:
+            ValueError: If the job has not failed or was deleted
+        """
+        with self.lock:
+            if self.jobs.get(job.id) is not job:
+                raise ValueError(f"Job {job.id} has been deleted")
+            if job.status != "failed":
+                raise ValueError(f"Job {job.id} is {job.status}, only failed jobs can be retried")
+            pipeline = self.pipelines[job.id]
+            job.status = "queued"
+            job.error = None
+            job.files = []
+            job.finished_at = None
+            job.disk_bytes = None
+
+        # New streams skip the previous attempt, its "done" event included
+        with job.events_lock:
+            job.attempt_start = len(job.events)
+        job.update("Waiting for a free worker")
+        self.executor.submit(self._run, job, pipeline)
+        logger.info(f"Queued retry of job {job.id}")
+        return job
+
+    def load(self) -> float:
+        """Running and queued jobs per worker."""
+        with self.lock:
+            active = sum(1 for job in self.jobs.values() if not job.finished)
+        return active / self.max_workers
+
+    def list(self) -> list:
+        with self.lock:
+            return list(self.jobs.values())
+
+    def forget_finished(self, job: Job) -> bool:
+        """
+        Stops tracking a finished job, e.g. before its work directory is deleted.
+
+        The check and the removal happen under the same lock as `retry`, so a
+        job is either retried or forgotten, never both.
+
+        Returns:
+            bool: False if the job is running again or no longer tracked
+        """
+        with self.lock:
+            if not job.finished or self.jobs.get(job.id) is not job:
+                return False
+            del self.jobs[job.id]
+            self.pipelines.pop(job.id, None)
+            return True
+
+    def _run(self, job: Job, pipeline):
+        job.status = "running"
+        job.started_at = time.time()
+        job.attempts += 1
+        job.update("Processing started" if job.attempts == 1 else f"Resuming processing (attempt {job.attempts})")
+        status, message = "failed", "Video processing failed"
+        try:
+            job.files = pipeline(job)
+            status, message = "completed", "Video processing completed successfully!"
+        except Exception as e:
+            logger.error(f"[job {job.id}] Processing error: {str(e)}")
+            job.error = str(e)
+        finally:
+            job.disk_bytes = dir_size(job.work_dir)
+            job.finished_at = time.time()
+            logger.info(f"[job {job.id}] {message}")
+            job.message = message
+            # The last events go out before the status flips, so an event stream
+            # that sees the job finished has already got every event, "done" included
+            job.emit("status", status=status, message=message)
+            job.emit(
+                "done", status=status, files=job.files, error=job.error, timings=job.timings, attempts=job.attempts
+            )
+            job.status = status
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
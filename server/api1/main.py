@@ -1,16 +1,30 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import List, Optional
 import os
+import re
 import logging
 from get_yt_transcript import fetch_and_save_transcript
-from video_reader import gemini_insights
-from video_segment import trim_video
-from dub import main_dub
+from video_reader import gemini_insights, get_gemini_pool, TranscriptBestPartsExtractor
+from video_segment import trim_video, merge_ranges, dedupe_segments
+from dub import dub_cache, dub_clips
+from jobs import Job, JobManager
+from retention import RetentionManager
+from quality import parse_quality, resolve_quality, video_format
+from cache import media_cache, youtube_video_id
+from stages import StageGraph
+from checkpoints import CheckpointStore
+from range_response import ranged_file_response
+from common.metrics import instrument_app, observe_stage, external_call
+from common.transcript import Transcript, load_transcript, save_transcript, export_json, FORMAT_VERSION as TRANSCRIPT_FORMAT_VERSION
 import yt_dlp
 import json
-import srt
+import time
+import queue
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # Configure logging
@@ -32,170 +46,575 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request metrics and /metrics endpoint
+instrument_app(app, "api1")
+
+# Bounded worker pool running the video pipelines
+job_manager = JobManager()
+
+# Deletes old job directories in the background
+retention = RetentionManager(job_manager)
+
+# Download only the selected time ranges instead of the whole video
+DOWNLOAD_SECTIONS = os.getenv("DOWNLOAD_SECTIONS", "1") == "1"
+# Seconds of video kept before and after every selected segment
+SECTION_PADDING = float(os.getenv("SECTION_PADDING", "2"))
+# Largest number of topics and of languages accepted by one batch request
+MAX_BATCH_TOPICS = int(os.getenv("MAX_BATCH_TOPICS", "8"))
+MAX_BATCH_LANGUAGES = int(os.getenv("MAX_BATCH_LANGUAGES", "8"))
+
+# BCP 47-style codes such as "hi", "pt-BR" or "zh-Hans"; batch outputs use them as folder names
+LANGUAGE_CODE_PATTERN = re.compile(r'[A-Za-z]{2,3}(?:-[A-Za-z0-9]{2,8})*')
+
 class VideoProcessRequest(BaseModel):
     url: str
     topic: str
     languageCode: str
+    # 360, 480, 720, 1080 or "auto"; DEFAULT_QUALITY when missing
+    quality: Optional[str] = None
 
-def srt_to_custom_json(srt_file, json_file):
-    """Converts SRT to custom JSON format."""
-    try:
-        logger.info(f"Reading SRT file: {srt_file}")
-        with open(srt_file, 'r', encoding='utf-8') as f:
-            srt_content = f.read()
-
-        logger.info("Parsing SRT content")
-        subtitles = list(srt.parse(srt_content))
-        data = []
-        for sub in subtitles:
-            start_seconds = sub.start.total_seconds()
-            end_seconds = sub.end.total_seconds()
-            duration = round(end_seconds - start_seconds, 2)
-
-            entry = {
-                "start_time": round(start_seconds, 2),
-                "end_time": round(end_seconds, 2),
-                "description": sub.content.strip(),
-                "duration": duration
-            }
-            data.append(entry)
+class BatchProcessRequest(BaseModel):
+    url: str
+    topics: List[str]
+    languageCodes: List[str]
+    quality: Optional[str] = None
 
-        logger.info(f"Writing JSON file: {json_file}")
-        with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4)
-            
-        logger.info("Successfully converted SRT to JSON")
-        return True
-    except Exception as e:
-        logger.error(f"Error converting SRT to JSON: {str(e)}")
-        raise Exception(f"Failed to convert SRT to JSON: {str(e)}")
+def download_progress_hook(progress):
+    """Turns yt-dlp progress reports into progress(percent, downloaded_bytes) calls."""
+    last = {"percent": None, "time": 0.0}
+
+    def hook(d):
+        if d.get('status') != 'downloading':
+            return
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        downloaded = d.get('downloaded_bytes') or 0
+        percent = int(downloaded * 100 / total) if total else None
+
+        # Report each new percent, or once a second when the size is unknown
+        now = time.monotonic()
+        if percent != last["percent"] or (percent is None and now - last["time"] >= 1):
+            last["percent"], last["time"] = percent, now
+            progress(percent, downloaded)
+
+    return hook
 
-def download_youtube_video(link):
-    """Download a YouTube video."""
+def full_video_cache_key(link, height=1080):
+    return f"{youtube_video_id(link)}.video-{height}.mp4"
+
+def transcript_cache_key(link):
+    # The format version keeps older binary transcripts from being reused
+    return f"{youtube_video_id(link)}.transcript-v{TRANSCRIPT_FORMAT_VERSION}.bin"
+
+def download_youtube_video(link, video_file="input.mp4", progress=None, height=1080):
+    """Download a YouTube video of at most `height` pixels, reporting progress(percent, downloaded_bytes) if given."""
     try:
-        video_file = "input.mp4"
-        
         if os.path.exists(video_file):
             logger.info(f"File '{video_file}' already exists. Deleting it.")
             os.remove(video_file)
 
+        if media_cache.get(full_video_cache_key(link, height), video_file):
+            logger.info("Video loaded from cache")
+            return True
+
         ydl_opts = {
-            'format': 'bestvideo[height<=1080][ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
+            'format': video_format(height),
             'outtmpl': video_file,
             'merge_output_format': 'mp4',
             'quiet': True,
             'no_warnings': True,
             'noprogress': False,
+            'progress_hooks': [download_progress_hook(progress)] if progress else [],
         }
         
         logger.info("Starting video download")
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with external_call("youtube", "download"), yt_dlp.YoutubeDL(ydl_opts) as ydl:
             ydl.download([link])
         
         if not os.path.exists(video_file):
             raise Exception("Video file was not created after download")
-            
+
+        media_cache.put(full_video_cache_key(link, height), video_file)
         logger.info("Video download completed successfully")
         return True
     except Exception as e:
         logger.error(f"Error downloading video: {str(e)}")
         raise Exception(f"Failed to download video: {str(e)}")
 
-@app.post("/process-video")
-async def process_video(request: VideoProcessRequest):
-    """Process a YouTube video"""
-    url = request.url
-    topic = request.topic
-    languageCode = request.languageCode
-    output_clips_folder = 'Clips'
+def download_youtube_sections(link, ranges, output_dir, progress=None, height=1080):
+    """
+    Download only the given time ranges of a YouTube video.
 
+    Ranges found in the media cache are reused, only the others are fetched.
+
+    Args:
+        link (str): The URL of the YouTube video
+        ranges (list): Non-overlapping (start, end) ranges in seconds
+        output_dir (str): Folder receiving one MP4 per range
+        progress (callable): Optional callback(percent, downloaded_bytes)
+        height (int): Maximum video height in pixels
+
+    Returns:
+        list: (path, start, end) for every downloaded range
+    """
     try:
-        # Ensure Clips directory exists
-        os.makedirs(output_clips_folder, exist_ok=True)
-        logger.info(f"Created/verified output directory: {output_clips_folder}")
+        video_id = youtube_video_id(link)
+        section_files = {}
+        missing = []
+        for start, end in ranges:
+            section_file = os.path.join(output_dir, f'section_{int(start)}.mp4')
+            section_files[(start, end)] = section_file
+            if not media_cache.get(f"{video_id}.section-{height}-{start:.2f}-{end:.2f}.mp4", section_file):
+                missing.append((start, end))
+
+        if missing:
+            ydl_opts = {
+                'format': video_format(height),
+                'outtmpl': os.path.join(output_dir, 'section_%(section_start)d.%(ext)s'),
+                'merge_output_format': 'mp4',
+                'download_ranges': yt_dlp.utils.download_range_func(None, missing),
+                'quiet': True,
+                'no_warnings': True,
+                'noprogress': False,
+                'progress_hooks': [download_progress_hook(progress)] if progress else [],
+            }
+
+            logger.info(f"Starting download of {len(missing)} video sections")
+            with external_call("youtube", "download_sections"), yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                ydl.download([link])
+
+        sections = []
+        for (start, end), section_file in section_files.items():
+            if not os.path.exists(section_file):
+                raise Exception(f"Section {start}-{end} was not created after download")
+            if (start, end) in missing:
+                media_cache.put(f"{video_id}.section-{height}-{start:.2f}-{end:.2f}.mp4", section_file)
+            sections.append((section_file, start, end))
 
-        # Step 1: Download and process transcript
-        logger.info("Starting transcript download")
-        transcript_result = fetch_and_save_transcript(url, output_file='transcript.srt')
+        logger.info("Video sections downloaded successfully")
+        return sections
+    except Exception as e:
+        logger.error(f"Error downloading video sections: {str(e)}")
+        raise Exception(f"Failed to download video sections: {str(e)}")
+
+def section_ranges(segments_file):
+    """Returns the padded, merged time ranges covering the selected segments."""
+    segments = load_transcript(segments_file).to_entries()
+
+    return merge_ranges([
+        (max(0.0, segment['start_time'] - SECTION_PADDING), segment['end_time'] + SECTION_PADDING)
+        for segment in segments
+    ])
+
+def select_batch_segments(topics, transcript_file, segments_file, job):
+    """
+    Runs segment selection for every topic concurrently and dedupes the result.
+
+    The unique segments are saved to `segments_file`; each topic gets the
+    list of clip names holding its segments.
+
+    Returns:
+        list: {"topic", "clips"} dicts, in the order of `topics`
+    """
+    extractor = TranscriptBestPartsExtractor()
+
+    # The pool's semaphore bounds the Gemini requests, threads only wait on them
+    with ThreadPoolExecutor(max_workers=len(topics), thread_name_prefix="insights") as executor:
+        selections = list(executor.map(
+            lambda indexed: extractor.extract_best_parts(
+                transcript_file, indexed[1], num_segments=3, output_file=job.path(f'best_segments_{indexed[0] + 1}.bin')
+            ),
+            enumerate(topics)
+        ))
+    segments, indices = dedupe_segments(selections)
+    save_transcript(
+        Transcript.from_cues((segment["start_time"], segment["end_time"], segment["description"]) for segment in segments),
+        segments_file
+    )
+    logger.info(f"[job {job.id}] {sum(len(s) for s in selections)} selected segments, {len(segments)} unique")
+
+    return [
+        {"topic": topic, "clips": [f"clip_{index + 1}.mp4" for index in topic_indices]}
+        for topic, topic_indices in zip(topics, indices)
+    ]
+
+def run_pipeline(job: Job):
+    """
+    Runs the transcript/insights/download/trim/dub pipeline inside the job's work directory.
+
+    The stages form a small graph: the full video download overlaps the
+    transcript and Gemini stages, and each clip is dubbed as soon as it
+    has been trimmed.
+
+    Batch jobs (with "topics" and "languageCodes" params) select segments
+    for every topic from the same transcript and download, trim each
+    unique time range once and dub it into output/<language>/.
+
+    Finished stages are checkpointed in the work directory, so a retried
+    job restores them and resumes from the first incomplete stage.
+    """
+    url = job.params["url"]
+    batch = "topics" in job.params
+    topics = job.params["topics"] if batch else [job.params["topic"]]
+    languages = job.params["languageCodes"] if batch else [job.params["languageCode"]]
+
+    # "auto" is resolved when the job first starts, against the load at that time;
+    # a retry keeps the same height so its checkpoints stay valid
+    if "height" not in job.params:
+        job.params["height"] = resolve_quality(job.params.get("quality"), job_manager.load())
+    height = job.params["height"]
+    job.emit("quality", height=height)
+
+    transcript_file = job.path('transcript.bin')
+    segments_file = job.path('best_segments.bin')
+    input_video = job.path('input.mp4')
+
+    apiKey = os.getenv('11_LABS')
+    if not apiKey:
+        raise Exception("ElevenLabs API key not found")
+
+    # Ensure Clips directory exists
+    os.makedirs(job.clips_dir, exist_ok=True)
+
+    def language_dir(language):
+        return os.path.join(job.output_dir, language) if batch else job.output_dir
+
+    def transcript_stage():
+        # A parsed transcript of this video skips the download and conversion
+        if media_cache.get(transcript_cache_key(url), transcript_file):
+            job.update("Using cached transcript")
+            return transcript_file
+
+        job.update("Downloading transcript")
+        transcript_result = fetch_and_save_transcript(url, output_file=transcript_file)
         if not transcript_result:
-            raise HTTPException(status_code=500, detail="Failed to fetch transcript")
-        logger.info("Transcript downloaded successfully")
+            raise Exception("Failed to fetch transcript")
 
         # Verify transcript file exists
-        if not os.path.exists('transcript.srt'):
-            raise HTTPException(status_code=500, detail="Transcript file not found after download")
-        
-        logger.info("Converting transcript to JSON")
-        json_result = srt_to_custom_json('transcript.srt', 'transcript.json')
-        if not json_result:
-            raise HTTPException(status_code=500, detail="Failed to convert transcript to JSON")
-        logger.info("Transcript converted to JSON successfully")
+        if not os.path.exists(transcript_file):
+            raise Exception("Transcript file not found after download")
+        media_cache.put(transcript_cache_key(url), transcript_file)
+        return transcript_file
 
-        # Step 2: Download video
-        logger.info("Starting video download")
-        video_result = download_youtube_video(url)
-        if not video_result:
-            raise HTTPException(status_code=500, detail="Failed to download video")
-        logger.info("Video downloaded successfully")
+    def insights_stage(transcript_file):
+        if batch:
+            job.update(f"Extracting insights for {len(topics)} topics")
+            job.summary = {"topics": select_batch_segments(topics, transcript_file, segments_file, job)}
+            job.emit("topics", topics=job.summary["topics"])
+            with open(job.path('best_segments.json'), 'w', encoding='utf-8') as f:
+                json.dump({
+                    "segments": load_transcript(segments_file).to_entries(),
+                    "topics": job.summary["topics"]
+                }, f, indent=2, ensure_ascii=False)
+            return segments_file
 
-        # Step 3: Extract insights
-        logger.info("Starting insights extraction")
-        insights_result = gemini_insights(topic)
+        job.update("Extracting insights")
+        insights_result = gemini_insights(topics[0], transcript_file, segments_file)
         if not insights_result:
-            raise HTTPException(status_code=500, detail="Failed to extract insights")
-        logger.info("Insights extracted successfully")
+            raise Exception("Failed to extract insights")
 
         # Verify segments file exists
-        if not os.path.exists('best_segments.json'):
-            raise HTTPException(status_code=500, detail="Segments file not found after insights extraction")
+        if not os.path.exists(segments_file):
+            raise Exception("Segments file not found after insights extraction")
+
+        # Human-readable copy of the selection
+        export_json(load_transcript(segments_file), job.path('best_segments.json'), indent=2)
+        return segments_file
+
+    def restore_insights(segments_file):
+        # The topic/clip mapping of batch jobs lives in the JSON export
+        if batch:
+            with open(job.path('best_segments.json'), 'r', encoding='utf-8') as f:
+                job.summary = {"topics": json.load(f)["topics"]}
+
+    def full_download_stage():
+        if media_cache.get(full_video_cache_key(url, height), input_video):
+            job.update("Using cached video")
+            return None
 
-        # Step 4: Trim video segments
-        logger.info("Starting video trimming")
-        trim_result = trim_video('input.mp4', 'best_segments.json', output_clips_folder)
+        job.update("Downloading video")
+        video_result = download_youtube_video(url, input_video, progress=report_download, height=height)
+        if not video_result:
+            raise Exception("Failed to download video")
+        return None
+
+    def sections_download_stage(segments_file):
+        job.update("Downloading selected video sections")
+        return download_youtube_sections(
+            url, section_ranges(segments_file), job.work_dir, progress=report_download, height=height
+        )
+
+    def report_download(percent, downloaded_bytes):
+        job.emit("download", percent=percent, downloaded_bytes=downloaded_bytes)
+
+    def report_encode(output_file, percent):
+        job.emit("encode", clip=os.path.basename(output_file), percent=percent)
+
+    # Trimmed clips are handed to every language's dub stage as they are written
+    clip_queues = {language: queue.Queue() for language in languages}
+
+    trimmed = []
+
+    def on_trimmed(done, total, output_file):
+        job.emit("clip", clip=os.path.basename(output_file), state="trimmed", done=done, total=total)
+        trimmed.append(output_file)
+        for clip_queue in clip_queues.values():
+            clip_queue.put(output_file)
+
+    def restore_trim(clips):
+        # Hand the clips of the previous attempt to the dub stages
+        for clip_queue in clip_queues.values():
+            for clip in clips:
+                clip_queue.put(clip)
+            clip_queue.put(None)
+
+    def trim_stage(segments_file, sections):
+        job.update("Trimming video segments")
+        try:
+            trim_result = trim_video(
+                input_video, segments_file, job.clips_dir, sections=sections,
+                progress=on_trimmed, encode_progress=report_encode, height=height
+            )
+        finally:
+            for clip_queue in clip_queues.values():
+                clip_queue.put(None)
         if not trim_result:
-            raise HTTPException(status_code=500, detail="Failed to trim video segments")
-        logger.info("Video segments trimmed successfully")
-
-        # Step 5: Translate and dub
-        logger.info("Starting video dubbing")
-        apiKey = os.getenv('11_LABS')
-        if not apiKey:
-            raise HTTPException(status_code=500, detail="ElevenLabs API key not found")
-        
-        dub_result = main_dub(apiKey, languageCode)
-        if not dub_result:
-            raise HTTPException(status_code=500, detail="Failed to dub video")
-        logger.info("Video dubbing completed successfully")
-
-        # Check output files
-        output_files = os.listdir(output_clips_folder)
-        if not output_files:
-            raise HTTPException(status_code=404, detail="No processed videos found")
-        
-        logger.info(f"Processing completed. Found {len(output_files)} output files")
-        return {
-            "message": "Video processing completed successfully!",
-            "files": output_files
-        }
+            raise Exception("Failed to trim video segments")
+        return sorted(trimmed)
 
-    except HTTPException as he:
-        logger.error(f"HTTP Exception: {str(he.detail)}")
-        raise he
-    except Exception as e:
-        logger.error(f"Processing error: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.get("/download-video/{filename}")
-async def download_video(filename: str):
-    """Download a processed video file."""
-    file_path = os.path.join("output", filename)
-    
-    if not os.path.exists("output"):
+    def dub_stage(language):
+        failed = []
+
+        def report_dub(video_file, state, **details):
+            job.emit("dub", clip=os.path.basename(video_file), language=language, state=state, **details)
+            if state == "failed":
+                failed.append(os.path.basename(video_file))
+
+        def run(segments_file, sections):
+            job.update(f"Dubbing video segments ({language})" if batch else "Dubbing video segments")
+            clip_queue = clip_queues[language]
+            dub_result = dub_clips(apiKey, language, iter(clip_queue.get, None), language_dir(language), on_status=report_dub)
+            if not dub_result:
+                raise Exception("Failed to dub video")
+            # Left incomplete, so a retry dubs the missing clips (finished ones come from the dub cache)
+            if failed:
+                raise Exception(f"Failed to dub {', '.join(sorted(failed))} ({language})")
+
+            folder = language_dir(language)
+            return sorted(
+                os.path.join(folder, name) for name in os.listdir(folder)
+                if os.path.isfile(os.path.join(folder, name))
+            )
+        return run
+
+    def on_stage(stage, state, duration):
+        job.emit("stage", stage=stage, state=state, duration=duration)
+        if state in ("finished", "failed"):
+            observe_stage("api1", stage, duration, "success" if state == "finished" else "error")
+
+    # Every dub stage waits on the trim stage, so they all need a worker
+    checkpoints = CheckpointStore(job.path('checkpoints.json'), context=job.params)
+    graph = StageGraph(max_workers=3 + len(languages), on_event=on_stage, checkpoints=checkpoints)
+    graph.add("transcript", transcript_stage)
+    graph.add("insights", insights_stage, deps=("transcript",), restore=restore_insights)
+    # Sections are only known once Gemini picked the segments, the full video is not
+    if DOWNLOAD_SECTIONS and not media_cache.has(full_video_cache_key(url, height)):
+        graph.add("download", sections_download_stage, deps=("insights",))
+    else:
+        graph.add("download", full_download_stage, outputs=lambda result: [input_video])
+    graph.add("trim", trim_stage, deps=("insights", "download"), restore=restore_trim)
+    for language in languages:
+        graph.add(f"dub-{language}" if batch else "dub", dub_stage(language), deps=("insights", "download"))
+
+    try:
+        graph.run()
+    finally:
+        job.timings = graph.report()
+        logger.info(f"[job {job.id}] Stage timings: {job.timings}")
+
+    # Check output files, relative to the output folder
+    output_files = []
+    for language in languages:
+        folder = language_dir(language)
+        if os.path.isdir(folder):
+            output_files.extend(
+                os.path.relpath(os.path.join(folder, name), job.output_dir)
+                for name in sorted(os.listdir(folder))
+                if os.path.isfile(os.path.join(folder, name))
+            )
+    if not output_files:
+        raise Exception("No processed videos found")
+
+    logger.info(f"Processing completed. Found {len(output_files)} output files")
+    return output_files
+
+@app.post("/process-video", status_code=202)
+async def process_video(request: VideoProcessRequest):
+    """Queue a YouTube video for processing and return the job ID right away."""
+    params = request.dict()
+    try:
+        params["quality"] = parse_quality(request.quality)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    job = job_manager.submit(run_pipeline, params)
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "message": job.message
+    }
+
+@app.post("/process-batch", status_code=202)
+async def process_batch(request: BatchProcessRequest):
+    """
+    Queue one YouTube video for several topics and languages.
+
+    The video and transcript are fetched once, segments overlapping across
+    topics are trimmed once, and every clip is dubbed into each language.
+    """
+    # Keep the first occurrence of every topic and language
+    topics = list(dict.fromkeys(topic.strip() for topic in request.topics if topic.strip()))
+    languages = list(dict.fromkeys(code.strip() for code in request.languageCodes if code.strip()))
+    if not topics or not languages:
+        raise HTTPException(status_code=400, detail="At least one topic and one language code are required")
+    if len(topics) > MAX_BATCH_TOPICS or len(languages) > MAX_BATCH_LANGUAGES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BATCH_TOPICS} topics and {MAX_BATCH_LANGUAGES} language codes are allowed"
+        )
+    invalid = [code for code in languages if not LANGUAGE_CODE_PATTERN.fullmatch(code)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid language codes: {', '.join(invalid)}")
+
+    try:
+        quality = parse_quality(request.quality)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    job = job_manager.submit(run_pipeline, {
+        "url": request.url, "topics": topics, "languageCodes": languages, "quality": quality
+    })
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "message": job.message
+    }
+
+def get_job_or_404(job_id: str) -> Job:
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Return the current status of a processing job."""
+    return get_job_or_404(job_id).to_dict()
+
+@app.post("/jobs/{job_id}/retry", status_code=202)
+async def retry_job(job_id: str):
+    """Resume a failed job from its first incomplete stage."""
+    job = get_job_or_404(job_id)
+    try:
+        job_manager.retry(job)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "message": job.message
+    }
+
+async def job_event_stream(job: Job, last_event_id: int):
+    """
+    Yields the job's events in SSE format until the job has finished.
+
+    Streams never go back past the start of the current attempt, so a
+    retried job does not replay the previous attempt's "done" event.
+    """
+    index = max(last_event_id + 1, job.attempt_start)
+    idle = 0.0
+    while True:
+        events = job.events[index:]
+        for event in events:
+            yield f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+        index += len(events)
+
+        if job.finished and index >= len(job.events):
+            break
+
+        # Comment lines keep proxies from closing an idle stream
+        idle = 0.0 if events else idle + 0.5
+        if idle >= 15:
+            idle = 0.0
+            yield ": keep-alive\n\n"
+        await asyncio.sleep(0.5)
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Stream stage transitions, progress and per-clip status as Server-Sent Events."""
+    job = get_job_or_404(job_id)
+    try:
+        last_event_id = int(request.headers.get("last-event-id") or -1)
+    except ValueError:
+        # Not an ID we handed out, replay from the start
+        last_event_id = -1
+    return StreamingResponse(
+        job_event_stream(job, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    """Return the processed files of a completed job."""
+    job = get_job_or_404(job_id)
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != "completed":
+        raise HTTPException(status_code=409, detail="Processing not completed yet.")
+
+    return {
+        "message": job.message,
+        "files": job.files
+    }
+
+@app.api_route("/download-video/{job_id}/{filename:path}", methods=["GET", "HEAD"])
+async def download_video(job_id: str, filename: str, request: Request):
+    """Download a processed video file, e.g. clip_1.mp4 or hi/clip_1.mp4 for batch jobs."""
+    job = get_job_or_404(job_id)
+    output_dir = os.path.realpath(job.output_dir)
+    file_path = os.path.realpath(os.path.join(output_dir, filename))
+
+    # Never serve anything outside the job's output folder
+    if not file_path.startswith(output_dir + os.sep) or not os.path.isfile(file_path):
         logger.error(f"File not found: {file_path}")
         raise HTTPException(status_code=404, detail=f"File {filename} not found")
 
     logger.info(f"Serving file: {file_path}")
-    return FileResponse(file_path, media_type="video/mp4", filename=filename)
+    return ranged_file_response(request, file_path, media_type="video/mp4", filename=os.path.basename(filename))
+
+@app.on_event("startup")
+def create_data_dirs():
+    # Created here rather than at import, so importing a module never touches the disk
+    job_manager.create()
+    media_cache.create()
+    dub_cache.create()
+
+@app.on_event("startup")
+def start_retention():
+    retention.start()
+
+@app.on_event("startup")
+def warm_up_clients():
+    # Configure Gemini once, before the first job needs it
+    try:
+        get_gemini_pool()
+    except Exception as e:
+        logger.warning(f"Gemini client not initialized at startup: {str(e)}")
+
+@app.on_event("shutdown")
+def shutdown_jobs():
+    retention.stop()
+    job_manager.shutdown()
 
 if __name__ == "__main__":
     import uvicorn
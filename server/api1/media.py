@@ -0,0 +1,180 @@
+import os
+import bisect
+import asyncio
+import functools
+import threading
+import subprocess
+from common.probe import FFPROBE_BINARY
+
+# ffmpeg executable, installed in the image through apt
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+# Moves the MP4 index to the front so playback starts before the download ends
+FASTSTART = ['-movflags', '+faststart']
+
+
+def run_ffmpeg(args):
+    """
+    Runs ffmpeg with the given arguments, overwriting existing outputs.
+
+    Raises:
+        subprocess.CalledProcessError: If ffmpeg exits with an error.
+    """
+    command = [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y", *args]
+    return subprocess.run(command, check=True, capture_output=True, text=True)
+
+
+def run_ffmpeg_progress(args, on_progress):
+    """
+    Runs ffmpeg like `run_ffmpeg`, calling on_progress(seconds) with the
+    output position reported by `-progress` while it encodes.
+
+    Raises:
+        subprocess.CalledProcessError: If ffmpeg exits with an error.
+    """
+    command = [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-nostats", "-y",
+               "-progress", "pipe:1", *args]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+    # Drained concurrently so a chatty ffmpeg never blocks on a full stderr pipe
+    stderr_lines = []
+    stderr_reader = threading.Thread(target=lambda: stderr_lines.extend(process.stderr), daemon=True)
+    stderr_reader.start()
+
+    try:
+        for line in process.stdout:
+            key, _, value = line.strip().partition('=')
+            # out_time_us (out_time_ms in older builds, despite its name) is in microseconds
+            if key in ('out_time_us', 'out_time_ms') and value.isdigit():
+                on_progress(int(value) / 1_000_000)
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        stderr_reader.join()
+    stderr = "".join(stderr_lines)
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stderr=stderr)
+
+
+def keyframe_times(video_path: str) -> list:
+    """
+    Lists the timestamps of the video keyframes, in seconds.
+
+    Only packet headers are read, so no frame is decoded. Results are
+    cached per path and modification time, like `common.probe.probe`.
+
+    Args:
+        video_path (str): Path to the video file
+
+    Returns:
+        list: Sorted keyframe timestamps
+    """
+    stat = os.stat(video_path)
+    return list(_keyframe_times(os.path.abspath(video_path), stat.st_mtime_ns, stat.st_size))
+
+
+@functools.lru_cache(maxsize=64)
+def _keyframe_times(video_path: str, mtime_ns: int, size: int) -> tuple:
+    result = subprocess.run([
+        FFPROBE_BINARY,
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        video_path
+    ], check=True, capture_output=True, text=True)
+
+    times = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            times.append(float(pts_time))
+    return tuple(sorted(times))
+
+
+def snap_to_keyframe(time: float, keyframes: list) -> float:
+    """Returns the last keyframe at or before `time`, so no requested frame is lost."""
+    index = bisect.bisect_right(keyframes, time + 1e-3)
+    if index == 0:
+        return 0.0
+    return keyframes[index - 1]
+
+
+def extract_audio(video_path: str, audio_path: str):
+    """
+    Writes the first audio track of a video to an .m4a file.
+
+    The AAC stream is copied as is; other codecs are encoded to AAC.
+    """
+    try:
+        run_ffmpeg(['-i', video_path, '-map', '0:a:0', '-vn', '-c:a', 'copy', audio_path])
+    except subprocess.CalledProcessError:
+        run_ffmpeg(['-i', video_path, '-map', '0:a:0', '-vn', '-c:a', 'aac', '-b:a', '128k', audio_path])
+
+
+def mux_audio(video_path: str, audio_path: str, output_path: str):
+    """
+    Replaces the audio of a video, copying the video stream without re-encoding.
+
+    Args:
+        video_path (str): Video whose picture is kept
+        audio_path (str): Any file whose first audio track becomes the new sound
+        output_path (str): Resulting MP4
+    """
+    run_ffmpeg([
+        '-i', video_path,
+        '-i', audio_path,
+        '-map', '0:v:0', '-map', '1:a:0',
+        '-c:v', 'copy',
+        '-c:a', 'aac',
+        '-shortest',
+        *FASTSTART,
+        output_path
+    ])
+
+
+async def mux_audio_stream(video_path: str, audio_chunks, output_path: str, audio_format: str):
+    """
+    Like `mux_audio`, with the new audio read from an async iterator of bytes.
+
+    The chunks are written to ffmpeg's stdin as they arrive, so muxing runs
+    while the audio is still downloading. Waiting for the pipe to drain
+    keeps memory bounded by the pipe buffer. The audio format must be
+    readable from a non-seekable stream (e.g. "mp3", not "mp4").
+
+    Raises:
+        subprocess.CalledProcessError: If ffmpeg exits with an error.
+    """
+    command = [
+        FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y",
+        '-i', video_path,
+        '-f', audio_format, '-i', 'pipe:0',
+        '-map', '0:v:0', '-map', '1:a:0',
+        '-c:v', 'copy',
+        '-c:a', 'aac',
+        '-shortest',
+        *FASTSTART,
+        output_path
+    ]
+    process = await asyncio.create_subprocess_exec(
+        *command, stdin=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    # Drained concurrently so a chatty ffmpeg never blocks on a full stderr pipe
+    stderr_task = asyncio.create_task(process.stderr.read())
+    try:
+        async for chunk in audio_chunks:
+            process.stdin.write(chunk)
+            await process.stdin.drain()
+        process.stdin.close()
+    except (BrokenPipeError, ConnectionResetError):
+        # ffmpeg gave up early (e.g. -shortest), its exit code tells why
+        pass
+    except BaseException:
+        process.kill()
+        await process.wait()
+        stderr_task.cancel()
+        raise
+
+    stderr = (await stderr_task).decode('utf-8', errors='replace')
+    if await process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stderr=stderr)
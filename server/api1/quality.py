@@ -0,0 +1,55 @@
+import os
+
+# Maximum video heights a request can ask for
+QUALITY_TIERS = (360, 480, 720, 1080)
+# Tier used when a request does not name one: a height or "auto"
+DEFAULT_QUALITY = os.getenv("DEFAULT_QUALITY", "1080")
+# Worker load (active jobs per worker) above which "auto" drops to each tier
+AUTO_LOAD_STEPS = ((2.0, 360), (1.5, 480), (1.0, 720))
+
+
+def parse_quality(value) -> str:
+    """
+    Validates a requested quality tier.
+
+    Returns:
+        str: "auto" or one of QUALITY_TIERS as a string
+
+    Raises:
+        ValueError: If the value is not a known tier
+    """
+    value = str(value or DEFAULT_QUALITY).strip().lower().rstrip('p')
+    if value == "auto" or (value.isdigit() and int(value) in QUALITY_TIERS):
+        return value
+    raise ValueError(f"Unknown quality {value!r}, expected auto or one of {QUALITY_TIERS}")
+
+
+def resolve_quality(value, load: float) -> int:
+    """
+    Turns a quality tier into the maximum video height of a job.
+
+    "auto" keeps 1080p while every job has a worker to itself and steps
+    down as jobs queue up, trading resolution for throughput.
+
+    Args:
+        value (str): Tier accepted by `parse_quality`
+        load (float): Active (running and queued) jobs per worker
+
+    Returns:
+        int: Maximum video height in pixels
+    """
+    value = parse_quality(value)
+    if value != "auto":
+        return int(value)
+    for threshold, height in AUTO_LOAD_STEPS:
+        if load > threshold:
+            return height
+    return QUALITY_TIERS[-1]
+
+
+def video_format(height: int) -> str:
+    """yt-dlp format selector for MP4 video no taller than `height`."""
+    return (
+        f'bestvideo[height<={height}][ext=mp4]+bestaudio[ext=m4a]'
+        f'/best[height<={height}][ext=mp4]/best[height<={height}]/best'
+    )
@@ -0,0 +1,126 @@
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+CHUNK_SIZE = 256 * 1024
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def iter_file(path: str, start: int, length: int):
+    """Yields `length` bytes of the file starting at `start`."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def parse_range(range_header: str, size: int):
+    """
+    Parses a single-range "bytes=" header.
+
+    Returns:
+        tuple: (start, end) inclusive, None for a header we do not serve
+            partially (multiple ranges, other units), or "unsatisfiable"
+    """
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if first == '' and last == '':
+        return None
+    if first != '' and last != '' and int(last) < int(first):
+        # Syntactically invalid, so the header is ignored (RFC 9110, 14.2)
+        return None
+    if size == 0:
+        # An empty file has no byte any range could select
+        return "unsatisfiable"
+    if first == '':
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return "unsatisfiable"
+        return max(0, size - length), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size:
+        return "unsatisfiable"
+    return start, min(end, size - 1)
+
+
+def is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def if_range_matches(request: Request, etag: str, last_modified: str) -> bool:
+    if_range = request.headers.get('if-range')
+    return if_range is None or if_range.strip() in (etag, last_modified)
+
+
+def ranged_file_response(request: Request, path: str, media_type: str, filename: str = None) -> Response:
+    """
+    Serves a file with HTTP Range, ETag and Last-Modified support.
+
+    Players can seek and start playback without downloading the whole
+    file: single byte ranges get a 206 Partial Content response, and
+    If-None-Match / If-Modified-Since revalidations get a 304.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
+
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag': etag,
+        'Last-Modified': last_modified,
+    }
+    if filename:
+        headers['Content-Disposition'] = f'inline; filename="{filename}"'
+
+    if is_not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    start, end, status_code = 0, size - 1, 200
+    range_header = request.headers.get('range')
+    if range_header and if_range_matches(request, etag, last_modified):
+        byte_range = parse_range(range_header, size)
+        if byte_range == "unsatisfiable":
+            headers['Content-Range'] = f'bytes */{size}'
+            return Response(status_code=416, headers=headers)
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    length = end - start + 1 if size else 0
+    headers['Content-Length'] = str(length)
+
+    if request.method == 'HEAD':
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+
+    return StreamingResponse(
+        iter_file(path, start, length),
+        status_code=status_code,
+        headers=headers,
+        media_type=media_type
+    )
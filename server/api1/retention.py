@@ -0,0 +1,133 @@
+import os
+import time
+import shutil
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs are deleted this many seconds after they end
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", str(24 * 3600)))
+# Total size of job work directories above which the oldest finished jobs are deleted
+JOBS_MAX_BYTES = int(os.getenv("JOBS_MAX_BYTES", str(20 * 1024 ** 3)))
+# Seconds between two retention sweeps
+RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", "300"))
+
+# Prefix of directories renamed away before being deleted
+TRASH_PREFIX = ".trash-"
+
+
+def dir_size(path: str) -> int:
+    """Returns the total size in bytes of the files below `path`."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def remove_tree(path: str):
+    """
+    Deletes a directory without ever exposing it half-deleted.
+
+    The directory is first renamed to a hidden trash name in the same
+    folder, which is atomic, and only then removed. Files still being
+    streamed stay readable until their handles are closed.
+    """
+    if not os.path.exists(path):
+        return
+    parent, name = os.path.split(os.path.abspath(path))
+    trash = os.path.join(parent, f"{TRASH_PREFIX}{name}")
+    os.replace(path, trash)
+    shutil.rmtree(trash, ignore_errors=True)
+
+
+class RetentionManager:
+    """
+    Keeps the disk use of job work directories bounded.
+
+    A background thread periodically deletes finished jobs older than
+    `ttl` seconds, then the oldest finished jobs while the jobs use more
+    than `max_bytes`. Running and queued jobs are never touched.
+    Directories left over by a previous process are deleted once their
+    mtime is older than `ttl`.
+
+    Args:
+        job_manager (JobManager): Jobs whose work directories are managed
+        ttl (int): Seconds a finished job is kept
+        max_bytes (int): Size cap of all job directories
+        interval (int): Seconds between two sweeps
+    """
+
+    def __init__(self, job_manager, ttl: int = JOB_TTL_SECONDS, max_bytes: int = JOBS_MAX_BYTES,
+                 interval: int = RETENTION_INTERVAL):
+        self.job_manager = job_manager
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._loop, name="retention", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _loop(self):
+        while not self.stopped.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Retention sweep failed: {str(e)}")
+            self.stopped.wait(self.interval)
+
+    def _evict(self, job, reason: str) -> bool:
+        # Re-checked under the job manager's lock: the job may have been retried since the snapshot
+        if not self.job_manager.forget_finished(job):
+            return False
+        remove_tree(job.work_dir)
+        logger.info(f"Deleted job {job.id} ({reason}, {job.disk_bytes or 0} bytes)")
+        return True
+
+    def sweep(self):
+        """Runs one TTL and size eviction pass."""
+        now = time.time()
+        jobs = self.job_manager.list()
+        known_dirs = {os.path.abspath(job.work_dir) for job in jobs}
+        self._remove_orphans(known_dirs, now)
+
+        # End times are read once: a job retried during the sweep loses its finished_at
+        finished = sorted(
+            ((job.finished_at, job) for job in jobs if job.finished and job.finished_at),
+            key=lambda item: item[0]
+        )
+        kept = []
+        for finished_at, job in finished:
+            if not (now - finished_at > self.ttl and self._evict(job, "expired")):
+                kept.append(job)
+
+        # Sizes of finished jobs are recorded once, running jobs are measured
+        total = sum(job.disk_bytes or 0 for job in kept)
+        total += sum(dir_size(job.work_dir) for job in jobs if not job.finished)
+        for job in kept:
+            if total <= self.max_bytes:
+                break
+            if self._evict(job, "over quota"):
+                total -= job.disk_bytes or 0
+
+    def _remove_orphans(self, known_dirs: set, now: float):
+        jobs_dir = self.job_manager.jobs_dir
+        for entry in os.scandir(jobs_dir):
+            if not entry.is_dir(follow_symlinks=False) or os.path.abspath(entry.path) in known_dirs:
+                continue
+            if entry.name.startswith(TRASH_PREFIX):
+                # Interrupted deletion
+                shutil.rmtree(entry.path, ignore_errors=True)
+            elif now - entry.stat().st_mtime > self.ttl:
+                remove_tree(entry.path)
+                logger.info(f"Deleted stale job directory {entry.name}")
@@ -0,0 +1,166 @@
+import time
+import logging
+from checkpoints import result_files
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    """A named step of a pipeline, run once all of its dependencies finished."""
+
+    def __init__(self, name: str, fn, deps, outputs=None, restore=None):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.outputs = outputs or result_files
+        self.restore = restore
+        self.started_at = None
+        self.finished_at = None
+
+
+class StageGraph:
+    """
+    Small dependency graph of pipeline stages.
+
+    Every stage is called with the results of its dependencies, in the
+    order they were declared. Stages whose dependencies are satisfied run
+    concurrently on a thread pool.
+
+    With a checkpoint store, finished stages are recorded and a stage
+    whose checkpoint is still valid is restored instead of run again.
+
+    Args:
+        max_workers (int): Maximum number of stages running at once
+        on_event (callable): Optional callback(stage, state, duration) for
+            "started", "finished", "failed" and "restored" transitions
+        checkpoints (CheckpointStore): Optional store of stage checkpoints
+    """
+
+    def __init__(self, max_workers: int = 4, on_event=None, checkpoints=None):
+        self.max_workers = max_workers
+        self.on_event = on_event
+        self.checkpoints = checkpoints
+        self.stages = {}
+        self.results = {}
+        self.started_at = None
+        self.finished_at = None
+
+    def add(self, name: str, fn, deps=(), outputs=None, restore=None):
+        """
+        Adds a stage.
+
+        Args:
+            name (str): Unique stage name
+            fn (callable): Called with the results of `deps`; with checkpoints
+                its result must be JSON-serializable
+            deps (tuple): Names of the stages this one depends on
+            outputs (callable): Optional callback(result) returning the files the
+                stage produced, by default the files named in its result
+            restore (callable): Optional callback(result) run when the stage is
+                restored from its checkpoint instead of being run
+        """
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dep}")
+        self.stages[name] = Stage(name, fn, deps, outputs, restore)
+
+    def _notify(self, stage: Stage, state: str):
+        if self.on_event is not None:
+            duration = stage.finished_at - stage.started_at if stage.finished_at else None
+            self.on_event(stage.name, state, duration)
+
+    def _run_stage(self, stage: Stage):
+        if self.checkpoints is not None:
+            restored, result = self.checkpoints.restore(stage.name, stage.deps)
+            if restored:
+                stage.started_at = stage.finished_at = time.monotonic()
+                if stage.restore is not None:
+                    stage.restore(result)
+                logger.info(f"Stage {stage.name} restored from checkpoint")
+                self._notify(stage, "restored")
+                return result
+
+        stage.started_at = time.monotonic()
+        self._notify(stage, "started")
+        state = "failed"
+        try:
+            result = stage.fn(*(self.results[dep] for dep in stage.deps))
+            if self.checkpoints is not None:
+                self.checkpoints.record(stage.name, stage.deps, result, stage.outputs(result))
+            state = "finished"
+            return result
+        finally:
+            stage.finished_at = time.monotonic()
+            logger.info(f"Stage {stage.name} took {stage.finished_at - stage.started_at:.2f}s")
+            self._notify(stage, state)
+
+    def run(self) -> dict:
+        """
+        Runs every stage and returns their results by name.
+
+        The first failing stage stops the scheduling of new stages and its
+        exception is raised once the running stages have returned.
+        """
+        self.started_at = time.monotonic()
+        pending = dict(self.stages)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="stage") as executor:
+            try:
+                while pending or running:
+                    for name, stage in list(pending.items()):
+                        if all(dep in self.results for dep in stage.deps):
+                            running[executor.submit(self._run_stage, stage)] = name
+                            del pending[name]
+
+                    if not running:
+                        raise RuntimeError(f"Stages {sorted(pending)} can never run")
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        # Re-raises the stage's exception
+                        self.results[name] = future.result()
+            finally:
+                self.finished_at = time.monotonic()
+
+        return self.results
+
+    def critical_path(self) -> list:
+        """
+        Returns the chain of stages that determined the total run time.
+
+        Walks back from the last stage to finish, each time following the
+        dependency that finished last.
+        """
+        finished = [stage for stage in self.stages.values() if stage.finished_at is not None]
+        if not finished:
+            return []
+
+        stage = max(finished, key=lambda s: s.finished_at)
+        path = [stage.name]
+        while stage.deps:
+            stage = max((self.stages[dep] for dep in stage.deps), key=lambda s: s.finished_at or 0)
+            path.append(stage.name)
+        return path[::-1]
+
+    def report(self) -> dict:
+        """Per-stage start offset and duration, plus the critical path."""
+        origin = self.started_at or 0
+        stages = {}
+        for stage in self.stages.values():
+            if stage.started_at is None:
+                continue
+            end = stage.finished_at or time.monotonic()
+            stages[stage.name] = {
+                "start": round(stage.started_at - origin, 3),
+                "duration": round(end - stage.started_at, 3),
+            }
+
+        total = (self.finished_at or time.monotonic()) - origin if self.started_at else 0
+        return {
+            "total": round(total, 3),
+            "stages": stages,
+            "critical_path": self.critical_path(),
+        }
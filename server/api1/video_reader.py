@@ -2,69 +2,174 @@ import google.generativeai as genai
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import ChatPromptTemplate
 import json
+import asyncio
+import threading
 from dotenv import load_dotenv
 import os
+from common.metrics import external_call
+from common.transcript import Transcript, load_transcript, save_transcript
 load_dotenv()
 # from kaggle_secrets import UserSecretsClient
 # user_secrets = UserSecretsClient()
 
-class TranscriptBestPartsExtractor:
-    def __init__(self, google_api_key):
+# Gemini model used to select the segments
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash-002")
+# Maximum number of Gemini requests in flight across all jobs
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "4"))
+
+PROMPT_TEMPLATE = """You are an AI trained to identify the most important and valuable parts of a transcript.
+        
+        The transcript is split into numbered windows of about 50-60 seconds.
+        Analyze these windows and select exactly {num_segments} most important ones that provide the most value about:
+        {topic}
+        Transcript windows (ID: text):
+        {segments}
+        
+        Requirements:
+        1. Return ONLY a JSON array with the IDs of the {num_segments} best windows, e.g. ["W3", "W7"]
+        2. Use only IDs from the list above
+        3. Prefer windows holding complete thoughts
+        4. Format as a valid JSON array
+        5. Do not add any extra text or explanations
+        
+        Return only the JSON array, nothing else."""
+
+# Parsed once and shared by every request
+PROMPT = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
+
+def build_candidate_windows(entries, min_duration=50, max_duration=60):
+    """
+    Merges consecutive transcript entries into candidate clip windows.
+
+    Entries are added to a window until it lasts at least `min_duration`
+    seconds, without letting it grow past `max_duration` when possible.
+    Windows get stable IDs (W1, W2, ...) in transcript order.
+
+    Args:
+        entries (list): Transcript entries with "start_time", "end_time" and "description"
+        min_duration (float): Target minimum window length in seconds
+        max_duration (float): Maximum window length in seconds
+
+    Returns:
+        list: Windows with "id", "start_time", "end_time", "description", "duration"
+    """
+    windows = []
+    current = []
+
+    def close_window():
+        start_time = current[0]["start_time"]
+        end_time = current[-1]["end_time"]
+        windows.append({
+            "id": f"W{len(windows) + 1}",
+            "start_time": start_time,
+            "end_time": end_time,
+            "description": " ".join(entry["description"] for entry in current if entry["description"]),
+            "duration": round(end_time - start_time, 2)
+        })
+        current.clear()
+
+    for entry in entries:
+        if current and entry["end_time"] - current[0]["start_time"] > max_duration:
+            close_window()
+        current.append(entry)
+        if current[-1]["end_time"] - current[0]["start_time"] >= min_duration:
+            close_window()
+
+    if current:
+        close_window()
+    return windows
+
+class GeminiClientPool:
+    """
+    Process-wide Gemini chat client shared by every job.
+
+    `genai.configure` and the client are set up once, so concurrent jobs
+    reuse the same connections. The async client binds its channel to the
+    event loop it is first used on, so the pool owns one long-lived loop
+    thread and runs every request there, whichever thread or loop it came
+    from. A semaphore on that loop bounds the number of requests in flight.
+
+    Args:
+        google_api_key (str): Gemini API key
+        concurrency (int): Maximum number of requests in flight
+    """
+
+    def __init__(self, google_api_key, concurrency=GEMINI_CONCURRENCY):
         # Configure Gemini
         genai.configure(api_key=google_api_key)
-        
+
         # Initialize Gemini model for chat
         self.llm = ChatGoogleGenerativeAI(
-            model="gemini-1.5-flash-002",
+            model=GEMINI_MODEL,
             temperature=0.7,
             google_api_key=google_api_key
         )
+        # Binds to the pool's loop on first use
+        self.slots = asyncio.Semaphore(max(1, concurrency))
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="gemini", daemon=True)
+        self.thread.start()
 
-    def extract_best_parts(self, transcript_file, topic, num_segments=2):
-        """Extract the most important segments using Gemini from transcript.json"""
-        
+    async def _invoke(self, messages):
+        async with self.slots:
+            with external_call("gemini", "select_segments"):
+                return await self.llm.ainvoke(messages)
+
+    def _submit(self, messages):
+        return asyncio.run_coroutine_threadsafe(self._invoke(messages), self.loop)
+
+    def invoke(self, messages):
+        """Blocking call, usable from any thread."""
+        return self._submit(messages).result()
+
+    async def ainvoke(self, messages):
+        """Awaitable from any event loop; cancelling it cancels the request on the pool's loop."""
+        return await asyncio.wrap_future(self._submit(messages))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_gemini_pool():
+    """Returns the process-wide Gemini pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = GeminiClientPool(os.getenv("GEMINI_API_KEY"))
+        return _pool
+
+
+class TranscriptBestPartsExtractor:
+    def __init__(self, pool=None):
+        self.pool = pool or get_gemini_pool()
+
+    def _prepare(self, transcript_file, topic, num_segments):
+        """Builds the candidate windows and the prompt messages for Gemini."""
         # Read the transcript file
         try:
-            with open(transcript_file, 'r', encoding='utf-8') as f:
-                json_data = json.load(f)
+            json_data = load_transcript(transcript_file).to_entries()
         except Exception as e:
             raise ValueError(f"Error reading transcript file: {str(e)}")
 
-        prompt_template = """You are an AI trained to identify the most important and valuable parts of a transcript.
-        
-        Analyze these transcript segments and select exactly {num_segments} most important parts that provide the most value about:
-        {topic}
-        Transcript segments:
-        {segments}
-        
-        Requirements:
-        1. Return ONLY a JSON array with the {num_segments} best segments
-        2. Each object must have exactly these keys: "start_time", "end_time", "description", "duration"
-        3. Keep the exact original timing information and text
-        4. Do not modify or summarize the text content
-        5. Include only complete thoughts/segments
-        6. Format as a valid JSON array
-        7. Do not add any extra text or explanations
-        8. the clips should be min 50 seconds in duration
-        9. the clip should be less then 60 seconds
-        
-        Return only the JSON array, nothing else."""
-        
-        prompt = ChatPromptTemplate.from_template(prompt_template)
-        
-        # Create JSON string of segments
-        segments_str = json.dumps(json_data, indent=2)
-        
+        # Gemini only picks window IDs, timings are kept locally
+        windows = build_candidate_windows(json_data)
+        if not windows:
+            raise ValueError("Transcript has no segments")
+
+        # One compact line per window
+        segments_str = "\n".join(f"{window['id']}: {window['description']}" for window in windows)
+
         # Create messages
-        messages = prompt.format_messages(
+        messages = PROMPT.format_messages(
             segments=segments_str,
             topic=topic,
             num_segments=num_segments
         )
-        
-        # Get response from Gemini
-        response = self.llm.invoke(messages)
-        
+        return windows, messages
+
+    def _select(self, response, windows, num_segments, output_file):
+        """Maps the window IDs chosen by Gemini back to segments and saves them."""
         # Extract JSON from response
         try:
             # Find the JSON array in the response
@@ -76,46 +181,63 @@ class TranscriptBestPartsExtractor:
                 raise ValueError("No JSON array found in response")
                 
             json_str = response_text[start_idx:end_idx]
-            best_segments = json.loads(json_str)
-            
-            # Validate each segment
-            for segment in best_segments:
-                # Check required fields
-                required_fields = ["start_time", "end_time", "description", "duration"]
-                if not all(field in segment for field in required_fields):
-                    raise ValueError("Missing required fields in segment")
-                
-                # Validate types
-                if not isinstance(segment["start_time"], (int, float)):
-                    raise ValueError("start_time must be a number")
-                if not isinstance(segment["end_time"], (int, float)):
-                    raise ValueError("end_time must be a number")
-                if not isinstance(segment["duration"], (int, float)):
-                    raise ValueError("duration must be a number")
-                if not isinstance(segment["description"], str):
-                    raise ValueError("description must be a string")
-                    
-            # Save the results to a new file
-            output_file = "best_segments.json"
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(best_segments, f, indent=2, ensure_ascii=False)
-                
-            print(f"Best segments saved to {output_file}")
-            return best_segments
-            
+            selected_ids = json.loads(json_str)
         except json.JSONDecodeError:
             raise ValueError("Failed to parse Gemini response as JSON")
 
-def gemini_insights(topic):
+        # Rebuild the exact timings from the chosen windows
+        windows_by_id = {window['id']: window for window in windows}
+        best_segments = []
+        for window_id in selected_ids:
+            window = windows_by_id.get(str(window_id).strip())
+            if window is not None and window not in best_segments:
+                best_segments.append(window)
+
+        if not best_segments:
+            raise ValueError("Gemini response did not contain any known window ID")
+
+        best_segments = [
+            {key: segment[key] for key in ("start_time", "end_time", "description", "duration")}
+            for segment in best_segments[:num_segments]
+        ]
+
+        # Save the results to a new file, in the same columnar format as transcripts
+        save_transcript(
+            Transcript.from_cues(
+                (segment["start_time"], segment["end_time"], segment["description"]) for segment in best_segments
+            ),
+            output_file
+        )
+            
+        print(f"Best segments saved to {output_file}")
+        return best_segments
+
+    def extract_best_parts(self, transcript_file, topic, num_segments=2, output_file="best_segments.bin"):
+        """Extract the most important segments using Gemini from a binary or JSON transcript"""
+        windows, messages = self._prepare(transcript_file, topic, num_segments)
+
+        # Get response from Gemini
+        response = self.pool.invoke(messages)
+        return self._select(response, windows, num_segments, output_file)
+
+    async def aextract_best_parts(self, transcript_file, topic, num_segments=2, output_file="best_segments.bin"):
+        """Async variant of `extract_best_parts`, for callers running an event loop"""
+        windows, messages = self._prepare(transcript_file, topic, num_segments)
+
+        # Get response from Gemini
+        response = await self.pool.ainvoke(messages)
+        return self._select(response, windows, num_segments, output_file)
+
+def gemini_insights(topic, transcript_file="transcript.bin", output_file="best_segments.bin"):
     # Your Google API key
     # GOOGLE_API_KEY = secret_value_0 = user_secrets.get_secret("GEMINI_API_KEY")
-    GOOGLE_API_KEY = secret_value_0 = os.getenv("GEMINI_API_KEY")
+    # The shared pool reads GEMINI_API_KEY once, when it is created
     
     # Initialize extractor
-    extractor = TranscriptBestPartsExtractor(GOOGLE_API_KEY)
+    extractor = TranscriptBestPartsExtractor()
     
     # Process transcript and get best parts
-    best_segments = extractor.extract_best_parts("transcript.json", topic, num_segments=3)
+    best_segments = extractor.extract_best_parts(transcript_file, topic, num_segments=3, output_file=output_file)
     
     # Print results
     print("\nBest transcript segments:")
@@ -123,4 +245,4 @@ def gemini_insights(topic):
     return (json.dumps(best_segments, indent=2))
 
 if __name__ == "__main__":
-    gemini_insights()
\ No newline at end of file
+    gemini_insights()
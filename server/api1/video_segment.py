@@ -1,38 +1,292 @@
-import json
 import os
-from moviepy.video.io.VideoFileClip import VideoFileClip
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from media import run_ffmpeg, run_ffmpeg_progress, keyframe_times, snap_to_keyframe, FASTSTART
+from common.probe import probe
+from common.transcript import load_transcript
 
-def trim_video(input_file, parts_file, output_folder):
+# "copy" cuts on keyframes without re-encoding, "reencode" renders every frame
+TRIM_MODE = os.getenv("TRIM_MODE", "copy")
+# Maximum number of segment groups re-encoded at the same time (0 = one per CPU)
+TRIM_WORKERS = int(os.getenv("TRIM_WORKERS", "0"))
+# Total libx264 threads shared by the workers (0 = number of CPUs)
+ENCODER_THREADS = int(os.getenv("ENCODER_THREADS", "0"))
+# Segments closer than this (in seconds) are re-encoded from a single decode pass
+TRIM_MERGE_GAP = float(os.getenv("TRIM_MERGE_GAP", "5"))
+
+def merge_ranges(ranges, gap=0.0):
+    """
+    Sorts (start, end) ranges and merges the ones that overlap or are
+    less than `gap` seconds apart.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start - merged[-1][1] <= gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def dedupe_segments(selections):
+    """
+    Merges the segments selected for several topics into unique time ranges.
+
+    Segments that overlap (including identical ones picked for different
+    topics) become a single segment, so each range is trimmed and dubbed
+    once. Segments that only touch are kept apart.
+
+    Args:
+        selections (list): One list of "start_time"/"end_time"/"description" dicts per topic
+
+    Returns:
+        tuple: (unique segments sorted by start, indices into them for each topic)
+    """
+    tagged = sorted(
+        (segment['start_time'], segment['end_time'], segment['description'], topic)
+        for topic, segments in enumerate(selections)
+        for segment in segments
+    )
+
+    merged = []
+    for start, end, description, topic in tagged:
+        if merged and start < merged[-1][1]:
+            last = merged[-1]
+            last[1] = max(last[1], end)
+            if description not in last[2]:
+                last[2].append(description)
+            last[3].add(topic)
+        else:
+            merged.append([start, end, [description], {topic}])
+
+    unique = [
+        {
+            "start_time": start,
+            "end_time": end,
+            "description": " ".join(descriptions),
+            "duration": round(end - start, 2)
+        }
+        for start, end, descriptions, _ in merged
+    ]
+    indices = [
+        [index for index, (_, _, _, topics) in enumerate(merged) if topic in topics]
+        for topic in range(len(selections))
+    ]
+    return unique, indices
+
+def find_section(start_time, end_time, sections):
+    """
+    Returns (path, offset) of the downloaded section covering the time range.
+
+    Args:
+        sections (list): (path, section start, section end) tuples
+    """
+    for path, section_start, section_end in sections:
+        if section_start <= start_time and end_time <= section_end:
+            return path, section_start
+    raise ValueError(f"No downloaded section covers {start_time}-{end_time}")
+
+def copy_segment(input_file, start_time, end_time, output_file, keyframes):
+    """
+    Cuts a segment by stream copy, starting at the keyframe before `start_time`.
+
+    Returns:
+        bool: True if the clip was written, False if the caller should re-encode.
+    """
+    cut_start = snap_to_keyframe(start_time, keyframes)
+    try:
+        run_ffmpeg([
+            '-ss', f'{cut_start:.3f}',
+            '-i', input_file,
+            '-t', f'{end_time - cut_start:.3f}',
+            '-map', '0:v:0', '-map', '0:a:0?',
+            '-c', 'copy',
+            '-avoid_negative_ts', 'make_zero',
+            *FASTSTART,
+            output_file
+        ])
+    except subprocess.CalledProcessError as e:
+        print(f'Stream copy failed for {output_file}: {e.stderr}')
+        return False
+    return os.path.exists(output_file) and os.path.getsize(output_file) > 0
+
+def group_segments(segments, gap=TRIM_MERGE_GAP):
+    """
+    Sorts segments and groups the ones of the same source that overlap or
+    are less than `gap` seconds apart.
+
+    Args:
+        segments (list): (input file, start, end, output file) tuples
+
+    Returns:
+        list: (input file, group start, group end, segments) tuples
+    """
+    groups = []
+    for segment in sorted(segments):
+        source, start_time, end_time, _ = segment
+        if groups and groups[-1][0] == source and start_time - groups[-1][2] <= gap:
+            groups[-1][2] = max(groups[-1][2], end_time)
+            groups[-1][3].append(segment)
+        else:
+            groups.append([source, start_time, end_time, [segment]])
+    return [tuple(group) for group in groups]
+
+def render_group(input_file, group_start, group_end, segments, threads, encode_progress=None, height=None):
+    """
+    Re-encodes several segments of one source from a single decode pass.
+
+    The merged range is decoded once; split/asplit hand every frame to one
+    trim/atrim chain per segment and each chain is encoded to its own
+    output, so the decode cost follows the merged duration. Sources taller
+    than `height` are scaled down once, before the split.
+
+    Returns:
+        list: The output files, in the order of `segments`
+    """
+    has_audio = probe(input_file).has_audio
+    count = len(segments)
+
+    scale = f"scale=-2:'min(ih,{height})'," if height else ""
+    filters = ["[0:v:0]%ssplit=%d%s" % (scale, count, "".join(f"[v{i}]" for i in range(count)))]
+    if has_audio:
+        filters.append("[0:a:0]asplit=%d%s" % (count, "".join(f"[a{i}]" for i in range(count))))
+
+    outputs = []
+    encoder_threads = str(max(1, threads // count))
+    for i, (_, start_time, end_time, output_file) in enumerate(segments):
+        start, end = start_time - group_start, end_time - group_start
+        filters.append(f"[v{i}]trim=start={start:.3f}:end={end:.3f},setpts=PTS-STARTPTS[vo{i}]")
+        outputs += ['-map', f'[vo{i}]']
+        if has_audio:
+            filters.append(f"[a{i}]atrim=start={start:.3f}:end={end:.3f},asetpts=PTS-STARTPTS[ao{i}]")
+            outputs += ['-map', f'[ao{i}]', '-c:a', 'aac']
+        outputs += ['-c:v', 'libx264', '-threads', encoder_threads, *FASTSTART, output_file]
+
+    last_percent = {}
+
+    def on_progress(position):
+        if encode_progress is None:
+            return
+        for _, start_time, end_time, output_file in segments:
+            done = position + group_start - start_time
+            percent = max(0, min(100, int(done * 100 / (end_time - start_time))))
+            if percent != last_percent.get(output_file):
+                last_percent[output_file] = percent
+                encode_progress(output_file, percent)
+
+    run_ffmpeg_progress([
+        '-ss', f'{group_start:.3f}',
+        '-t', f'{group_end - group_start:.3f}',
+        '-i', input_file,
+        '-filter_complex', ';'.join(filters),
+        *outputs
+    ], on_progress)
+    return [output_file for _, _, _, output_file in segments]
+
+def render_segments(segments, on_clip, workers=TRIM_WORKERS, encoder_threads=ENCODER_THREADS, encode_progress=None,
+                    height=None):
+    """
+    Re-encodes the segments, one ffmpeg decode pass per group of nearby segments.
+
+    Args:
+        segments (list): (input file, start, end, output file) tuples
+        on_clip (callable): Called with the output file of every finished clip
+        workers (int): Concurrency limit, 0 for one worker per CPU
+        encoder_threads (int): Encoder threads split across workers, 0 for one per CPU
+        encode_progress (callable): Optional callback(output_file, percent) while encoding
+        height (int): Optional maximum video height of the clips
+    """
+    groups = group_segments(segments)
+    cpus = os.cpu_count() or 1
+    workers = min(workers or cpus, len(groups))
+    threads = max(1, (encoder_threads or cpus) // workers)
+
+    # Each group is an ffmpeg process, threads only wait on them
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="render") as executor:
+        futures = [
+            executor.submit(render_group, input_file, group_start, group_end, members, threads, encode_progress, height)
+            for input_file, group_start, group_end, members in groups
+        ]
+        for future in as_completed(futures):
+            for output_file in future.result():
+                on_clip(output_file)
+
+def trim_video(input_file, parts_file, output_folder, mode=TRIM_MODE, progress=None, sections=None, encode_progress=None,
+               height=None):
+    """
+    Cuts the parts listed in `parts_file` into clip_<n>.mp4 files.
+
+    Args:
+        input_file (str): Path to the source video, unused when `sections` is given
+        parts_file (str): JSON file with "start_time"/"end_time" entries
+        output_folder (str): Folder receiving the clips
+        mode (str): "copy" for keyframe stream copy, "reencode" for a full encode
+        progress (callable): Optional callback(done, total, output_file) per clip
+        sections (list): Optional (path, start, end) tuples of partially
+            downloaded video; part timings are shifted into the section holding them
+        encode_progress (callable): Optional callback(output_file, percent) for re-encoded clips
+        height (int): Optional maximum video height; taller sources are re-encoded
+            instead of stream copied
+    """
     # Create the output folder if it doesn't exist
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
-    
-    # Load the parts from the JSON file
-    with open(parts_file, 'r') as f:
-        parts = json.load(f)
-    
-    # Load the input video
-    video = VideoFileClip(input_file)
-    
-    # Process each part and save the clips
+
+    # Load the parts from the segments file (binary or JSON)
+    parts = load_transcript(parts_file).to_entries()
+
+    # (input file, start, end, output file) for every part
+    segments = []
     for index, part in enumerate(parts):
-        start_time = part['start_time']
-        end_time = part['end_time']
-        duration = end_time - start_time
-        
-        # Trim the video for the given start and end times
-        clip = video.subclip(start_time, end_time)
-        
-        # Generate the output file name
+        source, offset = input_file, 0.0
+        if sections:
+            source, offset = find_section(part['start_time'], part['end_time'], sections)
+        start_time = part['start_time'] - offset
+        end_time = part['end_time'] - offset
+
+        # Keep the cut inside the file, using the cached container probe
+        duration = probe(source).duration
+        if duration:
+            end_time = min(end_time, duration)
+        if start_time >= end_time:
+            print(f'Skipping part {index + 1}: {start_time}-{end_time} is outside {source}')
+            continue
+
         output_file = os.path.join(output_folder, f'clip_{index + 1}.mp4')
-        
-        # Write the clip to a file
-        clip.write_videofile(output_file, codec='libx264', audio_codec='aac')
-        
-        print(f'Saved {output_file}')
-    
-    # Close the video file
-    video.close()
+        segments.append((source, start_time, end_time, output_file))
+    done = []
+
+    total = len(segments)
+
+    def on_clip(output_file):
+        done.append(output_file)
+        print(f'Saved {output_file} ({len(done)}/{total})')
+        if progress is not None:
+            progress(len(done), total, output_file)
+
+    # Stream copy what we can, the rest falls back to a full re-encode
+    if mode == 'copy':
+        keyframes = {}
+        remaining = []
+        for source, start_time, end_time, output_file in segments:
+            if source not in keyframes:
+                try:
+                    keyframes[source] = keyframe_times(source)
+                except (subprocess.CalledProcessError, OSError) as e:
+                    print(f'Could not read keyframes of {source}, re-encoding instead: {e}')
+                    keyframes[source] = []
+
+            # A copy keeps the source resolution, so only sources within the tier qualify
+            too_tall = height and (probe(source).height or 0) > height
+            if keyframes[source] and not too_tall and copy_segment(source, start_time, end_time, output_file, keyframes[source]):
+                on_clip(output_file)
+            else:
+                remaining.append((source, start_time, end_time, output_file))
+        segments = remaining
+
+    if not segments:
+        return "process completed"
+
+    render_segments(segments, on_clip, encode_progress=encode_progress, height=height)
     return "process completed"
 
 
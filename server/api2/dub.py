@@ -2,6 +2,7 @@ from elevenlabs import ElevenLabs
 import time
 import moviepy.editor as me
 import os
+from common.probe import probe
 
 def wait_for_dubbing_completion(dubbing_id: str, client) -> bool:
     """
@@ -41,7 +42,9 @@ def wait_for_dubbing_completion(dubbing_id: str, client) -> bool:
 
 def validate_video_file(video_path: str) -> bool:
     """
-    Validates if the video file exists and can be opened by MoviePy.
+    Validates if the video file exists and has a readable video stream.
+
+    Only the container headers are read, through the shared probe cache.
     
     Args:
         video_path (str): Path to the video file
@@ -54,13 +57,10 @@ def validate_video_file(video_path: str) -> bool:
             print(f"Video file not found: {video_path}")
             return False
             
-        clip = me.VideoFileClip(video_path)
-        if clip.reader is None:
+        if not probe(video_path).has_video:
             print(f"Cannot read video file: {video_path}")
-            clip.close()
             return False
             
-        clip.close()
         return True
     except Exception as e:
         print(f"Error validating video file {video_path}: {e}")
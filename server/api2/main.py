@@ -13,6 +13,7 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain.schema import SystemMessage, HumanMessage, AIMessage
 from trafilatura import fetch_url, extract
 from transcript import fetch_transcript
+from common.metrics import instrument_app, stage_timer, external_call
 # Load environment variables
 load_dotenv()
 groq_api_key = os.getenv("GROQ_API_KEY")
@@ -39,11 +40,13 @@ def search_bing(query: str) -> str:
     """Search for up-to-date information from reputable sources."""
     api_wrapper = BingSearchAPIWrapper(bing_subscription_key=os.getenv("BING_API_KEY"), k=3)
     tool = BingSearchResults(api_wrapper=api_wrapper)
-    return tool.invoke(query)
+    with external_call("bing", "search"):
+        return tool.invoke(query)
 
 @tool
 def get_youtube_transcript(url:str) -> str:
     """get the transcript from youtube with just one url as input"""
+    # fetch_captions records the YouTube call itself
     return fetch_transcript(url)
 
 @tool
@@ -133,6 +136,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request metrics and /metrics endpoint
+instrument_app(app, "api2")
+
 # Store chat histories for different users
 chat_histories: Dict[str, List[Dict[str, str]]] = {}
 
@@ -162,10 +168,11 @@ async def chat_endpoint(user_id: str, chat_message: ChatMessage):
         output = interactive(chat_message.message)
     else:
         # Use the agent_executor for regular responses
-        output = agent_executor.invoke({
-            "input": chat_message.message,
-            "chat_history": langchain_chat_history
-        })['output']
+        with stage_timer("api2", "agent_invoke"):
+            output = agent_executor.invoke({
+                "input": chat_message.message,
+                "chat_history": langchain_chat_history
+            })['output']
 
     chat_histories[user_id].append({"role": "human", "content": chat_message.message})
     chat_histories[user_id].append({"role": "ai", "content": output})
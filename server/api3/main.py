@@ -9,6 +9,7 @@ import os
 from langchain_community.tools.bing_search import BingSearchResults
 from langchain_community.utilities import BingSearchAPIWrapper
 from youtube_search import youtube_video_main
+from common.metrics import instrument_app, stage_timer, external_call
 
 # Load environment variables
 load_dotenv()
@@ -25,11 +26,15 @@ app.add_middleware(
     allow_headers=["*"],  # Specify allowed headers, e.g., ["Authorization", "Content-Type"]
 )
 
+# Request metrics and /metrics endpoint
+instrument_app(app, "api3")
+
 @tool("search engine")
 def search_engine(question: str) -> str:
     """search the internet using this tool with just your query"""
     api_wrapper = BingSearchAPIWrapper(bing_subscription_key=os.getenv("BING_API_KEY"), k=3)
-    tool = BingSearchResults(api_wrapper=api_wrapper).invoke(question)
+    with external_call("bing", "search"):
+        tool = BingSearchResults(api_wrapper=api_wrapper).invoke(question)
     return tool
 
 # @tool("video search")
@@ -227,7 +232,8 @@ async def process_topic(query: QueryModel, background_tasks: BackgroundTasks):
     def run_crew():
         global status
         try:
-            crew = my_crew.kickoff(inputs={"topic": query.topic})
+            with stage_timer("api3", "crew_kickoff"):
+                crew = my_crew.kickoff(inputs={"topic": query.topic})
             with open('output.md', 'w') as f:
                 f.write(str(crew))
             status["status"] = "completed"
@@ -5,6 +5,7 @@ from bs4 import BeautifulSoup
 from langchain_community.tools.bing_search import BingSearchResults
 from langchain_community.utilities import BingSearchAPIWrapper
 from dotenv import load_dotenv
+from common.metrics import external_call
 # Load environment variables
 load_dotenv()
 
@@ -22,7 +23,8 @@ def extract_article_text(url):
         }
         
         # Fetch webpage with timeout and headers
-        response = requests.get(url, headers=headers, timeout=10)
+        with external_call("web", "fetch_article"):
+            response = requests.get(url, headers=headers, timeout=10)
         response.raise_for_status()  # Raise exception for bad status codes
         
         # Parse HTML
@@ -60,7 +62,8 @@ def perform_bing_search(api_key, query, num_results=5):
         tool = BingSearchResults(api_wrapper=api_wrapper)
         
         # Perform the search
-        response = tool.invoke(query)
+        with external_call("bing", "search"):
+            response = tool.invoke(query)
         
         # Parse the response
         results = json.loads(response.replace("'", '"'))
@@ -1,4 +1,5 @@
 import yt_dlp
+from common.metrics import external_call
 
 def youtube_video_search(query: str, max_results: int = 3) -> list:
     """
@@ -26,7 +27,8 @@ def youtube_video_search(query: str, max_results: int = 3) -> list:
         
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             # Search on YouTube for the specified number of results
-            results = ydl.extract_info(f"ytsearch{max_results}:{query}", download=False)
+            with external_call("youtube", "search"):
+                results = ydl.extract_info(f"ytsearch{max_results}:{query}", download=False)
             video_details = []
 
             # Loop through each entry to extract details
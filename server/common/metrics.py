@@ -0,0 +1,196 @@
+"""
+Prometheus-style metrics shared by the APIs.
+
+Metrics are kept in process memory and rendered in the Prometheus text
+exposition format by the /metrics route that `instrument_app` mounts.
+"""
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from fastapi.responses import Response
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Buckets in seconds, for HTTP requests and for long pipeline work
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LONG_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value) -> list:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=REQUEST_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def _render_value(self, key, value) -> list:
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(float(bound))
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+REGISTRY = []
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency.",
+    ["service", "method", "path", "status"]
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served.",
+    ["service"]
+)
+STAGE_DURATION = Histogram(
+    "pipeline_stage_duration_seconds", "Duration of pipeline stages.",
+    ["service", "stage", "outcome"], buckets=LONG_BUCKETS
+)
+EXTERNAL_LATENCY = Histogram(
+    "external_call_duration_seconds", "Latency of calls to external providers.",
+    ["provider", "operation"], buckets=LONG_BUCKETS
+)
+EXTERNAL_ERRORS = Counter(
+    "external_call_errors_total", "Failed calls to external providers.",
+    ["provider", "operation"]
+)
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def observe_stage(service: str, stage: str, duration: float, outcome: str = "success"):
+    STAGE_DURATION.observe(duration, service=service, stage=stage, outcome=outcome)
+
+
+@contextmanager
+def stage_timer(service: str, stage: str):
+    """Records the duration of the wrapped block as a pipeline stage."""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        observe_stage(service, stage, time.perf_counter() - start, outcome)
+
+
+@contextmanager
+def external_call(provider: str, operation: str):
+    """Records latency of the wrapped call, and counts it as an error if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        EXTERNAL_ERRORS.inc(provider=provider, operation=operation)
+        raise
+    finally:
+        EXTERNAL_LATENCY.observe(time.perf_counter() - start, provider=provider, operation=operation)
+
+
+def instrument_app(app, service: str):
+    """
+    Records latency and in-flight counts of every request and mounts /metrics.
+
+    Paths are labelled with their route template (e.g. /jobs/{job_id}) to
+    keep the number of series bounded.
+    """
+    @app.middleware("http")
+    async def metrics_middleware(request, call_next):
+        REQUESTS_IN_FLIGHT.inc(service=service)
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            REQUESTS_IN_FLIGHT.dec(service=service)
+            route = request.scope.get("route")
+            REQUEST_LATENCY.observe(
+                time.perf_counter() - start,
+                service=service,
+                method=request.method,
+                path=getattr(route, "path", "unmatched"),
+                status=status
+            )
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return Response(render_metrics(), media_type=CONTENT_TYPE)
@@ -0,0 +1,74 @@
+import os
+import json
+import functools
+import subprocess
+from typing import NamedTuple, Optional
+
+FFPROBE_BINARY = os.getenv("FFPROBE_BINARY", "ffprobe")
+
+
+class MediaInfo(NamedTuple):
+    """Container-level metadata of a media file, read from its headers."""
+
+    path: str
+    format_name: str
+    duration: float
+    size: int
+    video_codec: Optional[str]
+    audio_codec: Optional[str]
+    width: Optional[int]
+    height: Optional[int]
+    streams: tuple
+
+    @property
+    def has_video(self) -> bool:
+        return self.video_codec is not None
+
+    @property
+    def has_audio(self) -> bool:
+        return self.audio_codec is not None
+
+
+@functools.lru_cache(maxsize=512)
+def _probe(path: str, mtime_ns: int, size: int) -> MediaInfo:
+    # mtime_ns and size are only part of the cache key: a rewritten file is probed again
+    result = subprocess.run([
+        FFPROBE_BINARY,
+        "-v", "error",
+        "-show_entries", "format=format_name,duration,size:stream=index,codec_type,codec_name,width,height,duration",
+        "-of", "json",
+        path
+    ], check=True, capture_output=True, text=True)
+    data = json.loads(result.stdout)
+
+    streams = tuple(data.get("streams", []))
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    fmt = data.get("format", {})
+
+    return MediaInfo(
+        path=path,
+        format_name=fmt.get("format_name", ""),
+        duration=float(fmt.get("duration") or 0.0),
+        size=size,
+        video_codec=video.get("codec_name") if video else None,
+        audio_codec=audio.get("codec_name") if audio else None,
+        width=video.get("width") if video else None,
+        height=video.get("height") if video else None,
+        streams=streams,
+    )
+
+
+def probe(path: str) -> MediaInfo:
+    """
+    Reads duration, streams and codecs of a media file without decoding it.
+
+    Results are cached per path and modification time, so repeated checks
+    of the same file cost a single ffprobe run.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+        subprocess.CalledProcessError: If ffprobe cannot read the file.
+    """
+    stat = os.stat(path)
+    return _probe(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
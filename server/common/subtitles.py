@@ -0,0 +1,85 @@
+"""
+In-process YouTube caption download through the yt_dlp library.
+
+The caption track is fetched straight into memory in its smallest native
+format and parsed there: no yt-dlp subprocess, no ffmpeg conversion and
+no files written to the working directory.
+"""
+import os
+import yt_dlp
+from common.transcript import Transcript, parse_transcript
+from common.metrics import external_call
+
+# Preferred caption languages, in order; the first track is used if none matches
+CAPTION_LANGUAGES = [code.strip() for code in os.getenv("CAPTION_LANGUAGES", "en").split(",") if code.strip()]
+# Native caption formats we can parse, smallest first
+CAPTION_FORMATS = ("srv1", "vtt")
+
+YDL_OPTIONS = {
+    'skip_download': True,
+    'quiet': True,
+    'no_warnings': True,
+    'noplaylist': True,
+}
+
+
+def _match_language(tracks: dict, languages) -> list:
+    for language in languages:
+        if language in tracks:
+            return tracks[language]
+        # e.g. "en-US", or "en-orig" for the original auto-caption track
+        for code, formats in tracks.items():
+            if code.startswith(f"{language}-"):
+                return formats
+    return []
+
+
+def pick_caption_track(info: dict, languages=CAPTION_LANGUAGES):
+    """
+    Picks the caption track to download from yt-dlp video info.
+
+    Uploaded subtitles win over auto-generated captions; within the chosen
+    language the smallest parseable format is used.
+
+    Returns:
+        dict: The yt-dlp format entry ("ext", "url", ...), or None
+    """
+    subtitles = info.get('subtitles') or {}
+    automatic = info.get('automatic_captions') or {}
+    candidates = [_match_language(subtitles, languages), _match_language(automatic, languages)]
+    # Any track beats no transcript; "-orig" marks the spoken language among auto-translations
+    candidates += list(subtitles.values())
+    candidates += [formats for code, formats in sorted(automatic.items(), key=lambda item: not item[0].endswith('-orig'))]
+
+    for formats in candidates:
+        for ext in CAPTION_FORMATS:
+            for entry in formats:
+                if entry.get('ext') == ext and entry.get('url'):
+                    return entry
+    return None
+
+
+def fetch_captions(video_url: str, languages=CAPTION_LANGUAGES) -> Transcript:
+    """
+    Downloads and parses the captions of a YouTube video in memory.
+
+    Args:
+        video_url (str): The URL of the YouTube video
+        languages (list): Preferred caption languages, in order
+
+    Returns:
+        Transcript: The raw (not yet normalized) captions
+
+    Raises:
+        ValueError: If the video has no caption track in a supported format
+    """
+    with external_call("youtube", "subtitles"):
+        with yt_dlp.YoutubeDL(YDL_OPTIONS) as ydl:
+            info = ydl.extract_info(video_url, download=False)
+            track = pick_caption_track(info, languages)
+            if track is None:
+                raise ValueError(f"No captions available for {video_url}")
+            with ydl.urlopen(track['url']) as response:
+                content = response.read().decode('utf-8')
+
+    return parse_transcript(content, track['ext'])
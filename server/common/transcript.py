@@ -0,0 +1,354 @@
+"""
+Transcript parsing and storage shared by the APIs.
+
+Captions are parsed in a single streaming pass over SRT or WebVTT lines
+into a `Transcript`, which keeps cue timings in two float arrays and all
+cue texts in one string addressed by offsets.
+
+Transcripts and selected segments are stored in a small columnar binary
+format: a fixed header (magic, version, flags, cue count) followed by the
+start, end and offset arrays and the UTF-8 text, optionally compressed
+with zlib. `export_json` still writes the list-of-dicts JSON layout.
+"""
+import re
+import sys
+import html
+import json
+import zlib
+import struct
+import bisect
+from array import array
+from xml.etree import ElementTree
+
+# Cues shorter than this (in seconds) are folded into their neighbour
+MIN_CUE_DURATION = 1.0
+# Maximum silence (in seconds) bridged when folding a short cue
+MAX_MERGE_GAP = 0.5
+
+
+def _overlap(previous: list, lines: list) -> int:
+    """Length of the longest suffix of `previous` that starts `lines`."""
+    for size in range(min(len(previous), len(lines)), 0, -1):
+        if previous[-size:] == lines[:size]:
+            return size
+    return 0
+
+
+def normalize_cues(cues, min_duration: float = MIN_CUE_DURATION, max_gap: float = MAX_MERGE_GAP) -> list:
+    """
+    Collapses the rolling duplicates of YouTube auto-captions.
+
+    Auto-captions show every line two or three times: once as the new
+    bottom line, then again as the top line of the next cues, often with
+    10 ms "flash" cues in between. Only the text that is new in each cue is
+    kept, starting at the time it first appears. Repeats extend the
+    previous cue instead, tiny cues are merged into their neighbour and
+    overlapping timings are clipped.
+
+    Args:
+        cues (iterable): (start, end, text) tuples, in seconds
+        min_duration (float): Cues shorter than this are merged
+        max_gap (float): Largest gap bridged when merging a short cue
+
+    Returns:
+        list: Normalized (start, end, text) tuples
+    """
+    normalized = []
+    previous_lines = []
+    last_line = ""
+
+    for start, end, text in cues:
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        new_lines = lines[_overlap(previous_lines, lines):]
+        if lines:
+            previous_lines = lines
+
+        # A line that grew word by word only contributes its new words
+        if new_lines and last_line and new_lines[0].startswith(last_line + " "):
+            new_lines[0] = new_lines[0][len(last_line):].strip()
+
+        if not new_lines:
+            if normalized:
+                normalized[-1][1] = max(normalized[-1][1], end)
+            continue
+
+        last_line = lines[-1]
+        text = " ".join(new_lines)
+        if normalized:
+            last = normalized[-1]
+            # Never let the previous cue run over this one
+            if last[0] <= start < last[1]:
+                last[1] = start
+
+            if (end - start < min_duration or last[1] - last[0] < min_duration) and start - last[1] <= max_gap:
+                last[1] = max(last[1], end)
+                last[2] = f"{last[2]} {text}"
+                continue
+
+        normalized.append([start, end, text])
+
+    return [(start, end, text) for start, end, text in normalized]
+
+
+TIMESTAMP_PATTERN = re.compile(r'(?:(\d+):)?(\d{1,2}):(\d{2})[,.](\d{1,3})')
+# VTT inline markup such as <00:00:01.000>, <c> and </c>
+TAG_PATTERN = re.compile(r'<[^>]*>')
+
+
+def parse_timestamp(value: str) -> float:
+    """Converts an SRT (00:01:02,500) or VTT (01:02.500) timestamp to seconds."""
+    match = TIMESTAMP_PATTERN.search(value)
+    if not match:
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    hours, minutes, seconds, millis = match.groups()
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds) + int(millis.ljust(3, '0')) / 1000
+
+
+def parse_captions(lines):
+    """
+    Yields (start, end, text) cues from SRT or WebVTT lines in one pass.
+
+    Cue numbers, the WEBVTT header, NOTE/STYLE/REGION blocks, cue settings
+    and inline VTT tags are dropped. Nothing but the current cue is kept
+    in memory, so files can be parsed straight from disk.
+    """
+    timing = None
+    text_lines = []
+
+    for raw_line in lines:
+        # Only a truly empty line ends a cue: auto-caption VTT opens many
+        # cues with a line holding a single space before the real text
+        if raw_line.rstrip('\r\n') == '':
+            if timing is not None and text_lines:
+                yield timing[0], timing[1], "\n".join(text_lines)
+            timing = None
+            text_lines = []
+            continue
+
+        line = raw_line.strip().lstrip('\ufeff')
+        if not line:
+            continue
+
+        if '-->' in line:
+            start, _, end = line.partition('-->')
+            # VTT cue settings follow the end timestamp
+            timing = (parse_timestamp(start), parse_timestamp(end.split()[0]))
+            text_lines = []
+        elif timing is not None:
+            text = TAG_PATTERN.sub('', line).strip()
+            if text:
+                text_lines.append(text)
+
+    if timing is not None and text_lines:
+        yield timing[0], timing[1], "\n".join(text_lines)
+
+
+class Transcript:
+    """
+    Compact, array-backed list of caption cues.
+
+    Args:
+        starts (array): Cue start times in seconds ('d' array)
+        ends (array): Cue end times in seconds ('d' array)
+        offsets (array): len(cues) + 1 positions of each cue's text in `text` ('q' array)
+        text (str): Texts of all cues, concatenated
+    """
+
+    __slots__ = ("starts", "ends", "offsets", "text")
+
+    def __init__(self, starts: array, ends: array, offsets: array, text: str):
+        self.starts = starts
+        self.ends = ends
+        self.offsets = offsets
+        self.text = text
+
+    @classmethod
+    def from_cues(cls, cues) -> "Transcript":
+        """Builds a transcript from (start, end, text) tuples sorted by start."""
+        starts, ends, offsets = array('d'), array('d'), array('q', [0])
+        texts = []
+        position = 0
+        for start, end, text in cues:
+            starts.append(start)
+            ends.append(end)
+            texts.append(text)
+            position += len(text)
+            offsets.append(position)
+        return cls(starts, ends, offsets, "".join(texts))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __iter__(self):
+        for index in range(len(self.starts)):
+            yield self.starts[index], self.ends[index], self.text_at(index)
+
+    def text_at(self, index: int) -> str:
+        return self.text[self.offsets[index]:self.offsets[index + 1]]
+
+    def slice(self, start_time: float, end_time: float) -> "Transcript":
+        """
+        Returns the cues overlapping [start_time, end_time).
+
+        Cue bounds are found by binary search and the arrays are copied as
+        contiguous slices, so no cue outside the range is visited.
+        """
+        first = bisect.bisect_right(self.ends, start_time)
+        last = bisect.bisect_left(self.starts, end_time)
+        if last <= first:
+            return Transcript(array('d'), array('d'), array('q', [0]), "")
+
+        base = self.offsets[first]
+        return Transcript(
+            self.starts[first:last],
+            self.ends[first:last],
+            array('q', (offset - base for offset in self.offsets[first:last + 1])),
+            self.text[base:self.offsets[last]]
+        )
+
+    def normalized(self, **kwargs) -> "Transcript":
+        """Returns a copy with rolling auto-caption duplicates collapsed, see `normalize_cues`."""
+        return Transcript.from_cues(normalize_cues(self, **kwargs))
+
+    def plain_text(self, separator: str = " ") -> str:
+        return separator.join(self.text_at(index) for index in range(len(self)))
+
+    def to_entries(self) -> list:
+        """Cues as the {"start_time", "end_time", "description", "duration"} dicts used in transcript.json."""
+        return [
+            {
+                "start_time": round(start, 2),
+                "end_time": round(end, 2),
+                "description": text,
+                "duration": round(end - start, 2)
+            }
+            for start, end, text in self
+        ]
+
+
+def parse_srv1(content: str):
+    """
+    Yields (start, end, text) cues from YouTube's srv1 XML captions.
+
+    srv1 is the smallest caption format YouTube serves: one
+    <text start="..." dur="..."> element per line, without the rolling
+    repeats of auto-generated VTT.
+    """
+    for element in ElementTree.fromstring(content).iter('text'):
+        text = html.unescape(element.text or '').strip()
+        if not text:
+            continue
+        start = float(element.get('start', 0))
+        yield start, start + float(element.get('dur', 0)), text
+
+
+def parse_transcript(content: str, ext: str = 'srt') -> Transcript:
+    """Parses SRT, WebVTT or srv1 text (`ext` "srt", "vtt" or "srv1") into a Transcript."""
+    if ext == 'srv1':
+        return Transcript.from_cues(parse_srv1(content))
+    return Transcript.from_cues(parse_captions(content.splitlines()))
+
+
+def read_transcript(path: str) -> Transcript:
+    """Streams an SRT or WebVTT file from disk into a Transcript."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return Transcript.from_cues(parse_captions(f))
+
+
+# Header of the binary format: magic, version, flags, cue count
+MAGIC = b"SBTR"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+FLAG_ZLIB = 0x1
+# zlib level used when compressing stored transcripts
+COMPRESSION_LEVEL = 6
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _read_array(typecode: str, payload: memoryview, start: int, count: int):
+    values = array(typecode)
+    end = start + count * values.itemsize
+    values.frombytes(payload[start:end])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values, end
+
+
+def dumps_transcript(transcript: Transcript, compress: bool = True) -> bytes:
+    """
+    Serializes a transcript to the columnar binary format.
+
+    Args:
+        transcript (Transcript): Cues to store
+        compress (bool): Compress the columns with zlib
+
+    Returns:
+        bytes: Header followed by the (optionally compressed) columns
+    """
+    payload = b"".join((
+        _little_endian(transcript.starts),
+        _little_endian(transcript.ends),
+        _little_endian(transcript.offsets),
+        transcript.text.encode("utf-8"),
+    ))
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload, COMPRESSION_LEVEL)
+        flags |= FLAG_ZLIB
+    return HEADER.pack(MAGIC, FORMAT_VERSION, flags, len(transcript)) + payload
+
+
+def loads_transcript(data: bytes) -> Transcript:
+    """Deserializes a transcript written by `dumps_transcript`."""
+    magic, version, flags, count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a transcript file")
+    if version > FORMAT_VERSION:
+        raise ValueError(f"Unsupported transcript format version {version}")
+
+    payload = data[HEADER.size:]
+    if flags & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    payload = memoryview(payload)
+
+    starts, position = _read_array('d', payload, 0, count)
+    ends, position = _read_array('d', payload, position, count)
+    offsets, position = _read_array('q', payload, position, count + 1)
+    text = bytes(payload[position:]).decode("utf-8")
+    return Transcript(starts, ends, offsets, text)
+
+
+def save_transcript(transcript: Transcript, path: str, compress: bool = True):
+    """Writes a transcript to `path` in the binary format."""
+    with open(path, 'wb') as f:
+        f.write(dumps_transcript(transcript, compress))
+
+
+def load_transcript(path: str) -> Transcript:
+    """
+    Loads a transcript or segment list from `path`.
+
+    Files in the binary format are detected by their magic bytes; anything
+    else is read as the JSON list written by `export_json`.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:len(MAGIC)] == MAGIC:
+        return loads_transcript(data)
+
+    entries = json.loads(data.decode('utf-8'))
+    return Transcript.from_cues(
+        (entry["start_time"], entry["end_time"], entry["description"]) for entry in entries
+    )
+
+
+def export_json(transcript: Transcript, path: str, indent: int = 4):
+    """Writes a transcript as the list of dicts used by transcript.json."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(transcript.to_entries(), f, indent=indent, ensure_ascii=False)